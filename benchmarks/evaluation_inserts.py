@@ -0,0 +1,102 @@
+"""Compare storing a feedback's evaluations row by row with one commit each against the batched transaction.
+
+Needs the configured MySQL database. Run from the repository root:
+
+    python3 -m benchmarks.evaluation_inserts --evaluations 10 --rounds 20
+
+Every row written is removed again at the end.
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime
+
+from xid import Xid
+
+from database import db_cursor, insert_evaluation, insert_evaluations, mark_feedback_as_calculated, ROLLUP_NAME
+from evaluation_specs import EVALUATION_TOPICS
+
+
+def benchmark_evaluations(subject_name, count):
+    evaluations = []
+    for index in range(count):
+        evaluation = {'EvaluationTargetType': 3, 'SubjectName': subject_name, 'SentimentData': []}
+        for topic in EVALUATION_TOPICS:
+            evaluation[topic] = index % 5 + 1
+            evaluation[f'{topic}Weight'] = 0.5
+        evaluations.append(evaluation)
+    return evaluations
+
+
+def create_feedback():
+    feedback_id = Xid().string()
+    with db_cursor() as (conn, cursor):
+        cursor.execute("INSERT INTO Feedback (ID, Timestamp, IsCalculated) VALUES (%s, %s, FALSE)",
+                       (feedback_id, datetime.now()))
+        conn.commit()
+    return feedback_id
+
+
+def store_row_by_row(feedback_id, evaluations):
+    for evaluation in evaluations:
+        insert_evaluation(None, feedback_id, evaluation)
+    mark_feedback_as_calculated(feedback_id)
+
+
+def store_batched(feedback_id, evaluations):
+    insert_evaluations(None, feedback_id, evaluations)
+
+
+def cleanup(feedback_ids, subject_name):
+    placeholders = ", ".join(["%s"] * len(feedback_ids))
+    with db_cursor() as (conn, cursor):
+        cursor.execute(f"DELETE FROM Evaluation WHERE FeedbackID IN ({placeholders})", feedback_ids)
+        cursor.execute(f"DELETE FROM Feedback WHERE ID IN ({placeholders})", feedback_ids)
+        cursor.execute("DELETE FROM EvaluationRollup WHERE TargetKind = %s AND TargetKey = %s",
+                       (ROLLUP_NAME, subject_name))
+        cursor.execute("DELETE FROM EvaluationTrendRollup WHERE TargetKind = %s AND TargetKey = %s",
+                       (ROLLUP_NAME, subject_name))
+        conn.commit()
+
+
+def run(store, evaluations, rounds, feedback_ids):
+    durations = []
+    for _ in range(rounds):
+        feedback_id = create_feedback()
+        feedback_ids.append(feedback_id)
+        started = time.perf_counter()
+        store(feedback_id, evaluations)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def report(name, durations, count):
+    durations_ms = sorted(duration * 1000 for duration in durations)
+    p95 = durations_ms[min(len(durations_ms) - 1, int(len(durations_ms) * 0.95))]
+    print(f"{name:<12} mean {statistics.mean(durations_ms):8.2f} ms  p50 {statistics.median(durations_ms):8.2f} ms  "
+          f"p95 {p95:8.2f} ms  per evaluation {statistics.mean(durations_ms) / count:6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--evaluations", type=int, default=10, help="Evaluations per feedback")
+    parser.add_argument("--rounds", type=int, default=20, help="Feedbacks stored by each strategy")
+    args = parser.parse_args()
+
+    subject_name = f"benchmark-{Xid().string()}"
+    evaluations = benchmark_evaluations(subject_name, args.evaluations)
+    feedback_ids = []
+    try:
+        row_by_row = run(store_row_by_row, evaluations, args.rounds, feedback_ids)
+        batched = run(store_batched, evaluations, args.rounds, feedback_ids)
+    finally:
+        if feedback_ids:
+            cleanup(feedback_ids, subject_name)
+
+    print(f"{args.rounds} feedbacks with {args.evaluations} evaluations each")
+    report("row by row", row_by_row, args.evaluations)
+    report("batched", batched, args.evaluations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Local stand-ins for the OpenAI and Slack Web APIs, used by the load test.
+
+OpenAI: POST /v1/chat/completions answers after a configurable latency, with a canned reply,
+a canned insert_evaluation function call when functions are given, or server-sent chunks when
+stream is set. Slack: POST /api/<method> answers ok and records every chat.postMessage.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+
+import tornado.httpserver
+import tornado.ioloop
+import tornado.testing
+import tornado.web
+
+from evaluation_specs import EVALUATION_TOPICS
+
+RELATION_USER_ID = re.compile(r"""\\?['"]UserID\\?['"]: \\?['"](\w+)""")
+CANNED_REPLY = "Thank you for sharing that. Could you tell me a bit more about how it affected your work?"
+
+
+def canned_evaluations(messages):
+    """One company and one person evaluation, with the person taken from the relations in the prompt if any."""
+    # Relations are rendered into the prompt as Python reprs, possibly escaped once more
+    match = RELATION_USER_ID.search(" ".join(message.get("content") or "" for message in messages))
+    subject_user_id = match.group(1) if match else ""
+
+    evaluations = []
+    for target_type, prefix in ((1, "Company_"), (2, "Person_")):
+        evaluation = {"EvaluationTargetType": target_type, "SubjectUserID": subject_user_id if target_type == 2 else "",
+                      "SubjectName": "colleague" if target_type == 2 else "",
+                      "SentimentData": [{"word": "helpful", "weight": 0.9, "count": 1}]}
+        for topic in EVALUATION_TOPICS:
+            if topic.startswith(prefix):
+                evaluation[topic] = random.randint(0, 100)
+                evaluation[f"{topic}Weight"] = round(random.uniform(0.1, 1.0), 2)
+        evaluations.append(evaluation)
+    return {"evaluations": evaluations}
+
+
+class FakeChatCompletionsHandler(tornado.web.RequestHandler):
+    def initialize(self, latency, jitter):
+        self.latency = latency
+        self.jitter = jitter
+
+    async def post(self):
+        request = json.loads(self.request.body)
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+        if request.get("functions"):
+            message = {"role": "assistant", "content": None, "function_call": {
+                "name": "insert_evaluation", "arguments": json.dumps(canned_evaluations(request["messages"]))}}
+        else:
+            message = {"role": "assistant", "content": CANNED_REPLY}
+
+        if request.get("stream"):
+            await self.write_stream(request, message["content"] or "")
+            return
+
+        self.write({
+            "id": "chatcmpl-loadtest", "object": "chat.completion", "created": int(time.time()),
+            "model": request.get("model"),
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    async def write_stream(self, request, content):
+        self.set_header("Content-Type", "text/event-stream")
+        for index, word in enumerate(content.split(" ")):
+            delta = {"content": word if index == 0 else " " + word}
+            chunk = {"id": "chatcmpl-loadtest", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": request.get("model"), "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            self.write(f"data: {json.dumps(chunk)}\n\n")
+            await self.flush()
+        self.write("data: [DONE]\n\n")
+
+
+class SlackRecorder:
+    """Counts the messages the bot posts per channel, so the load test can wait for its replies."""
+
+    def __init__(self):
+        self.posts = defaultdict(int)
+        self.calls = defaultdict(int)
+        self._condition = threading.Condition()
+
+    def record(self, method, channel):
+        with self._condition:
+            self.calls[method] += 1
+            if method == "chat.postMessage":
+                self.posts[channel] += 1
+                self._condition.notify_all()
+
+    def post_count(self, channel):
+        with self._condition:
+            return self.posts[channel]
+
+    def total_posts(self):
+        with self._condition:
+            return sum(self.posts.values())
+
+    def wait_for(self, predicate, timeout):
+        with self._condition:
+            return self._condition.wait_for(predicate, timeout)
+
+
+class FakeSlackHandler(tornado.web.RequestHandler):
+    def initialize(self, recorder):
+        self.recorder = recorder
+
+    def post(self, method):
+        if self.request.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(self.request.body or b"{}")
+        else:
+            params = {key: self.get_body_argument(key) for key in self.request.body_arguments}
+
+        channel = params.get("channel")
+        self.recorder.record(method, channel)
+
+        if method == "auth.test":
+            self.write({"ok": True, "url": "https://loadtest.slack.com/", "team": "loadtest", "user": "wevo",
+                        "team_id": "TLOADTEST", "user_id": "UWEVOBOT", "bot_id": "BWEVOBOT"})
+        elif method in ("chat.postMessage", "chat.update"):
+            self.write({"ok": True, "channel": channel, "ts": params.get("ts") or f"{time.time():.6f}",
+                        "message": {"text": params.get("text")}})
+        else:
+            self.write({"ok": True})
+
+
+def make_fake_app(recorder, latency, jitter):
+    return tornado.web.Application([
+        (r"/v1/chat/completions", FakeChatCompletionsHandler, {"latency": latency, "jitter": jitter}),
+        (r"/api/([\w.]+)", FakeSlackHandler, {"recorder": recorder}),
+    ])
+
+
+def start_fake_services(recorder, latency, jitter):
+    """Serve both stand-ins on a free local port from a background thread and return the port."""
+    sock, port = tornado.testing.bind_unused_port()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        server = tornado.httpserver.HTTPServer(make_fake_app(recorder, latency, jitter))
+        server.add_sockets([sock])
+        started.set()
+        tornado.ioloop.IOLoop.current().start()
+
+    threading.Thread(target=run, name="wevo-fake-services", daemon=True).start()
+    started.wait()
+    return port
@@ -0,0 +1,193 @@
+"""Replay synthetic Slack traffic through the handlers of slack.py against local OpenAI and Slack stand-ins.
+
+Needs the configured MySQL database, preferably a scratch one: the synthetic users, feedbacks and
+evaluations are left in place. Run from the repository root:
+
+    python3 -m benchmarks.loadtest --users 50 --turns 5 --rate 5 --llm-latency 0.8
+
+Every synthetic user starts a session, sends its turns one reply at a time and, for the share set
+by --evaluate-ratio, finishes with !manual-evaluate. Sessions start at --rate per second, so the
+evaluations arrive in bursts behind the turns. Replies are not streamed, so a turn lasts until the
+bot has posted its answer.
+"""
+import argparse
+import os
+import random
+import statistics
+import threading
+import time
+
+from slack_bolt.request import BoltRequest
+from xid import Xid
+
+from benchmarks.fake_services import SlackRecorder, start_fake_services
+
+# Slack posts each handler makes for one event when replies are not streamed
+POSTS_PER_EVENT = {"start": 2, "turn": 1, "evaluate": 1}
+DB_STATUS_COUNTERS = ["Questions", "Com_select", "Com_insert", "Com_update", "Com_delete"]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def db_status(db_cursor):
+    with db_cursor() as (_, cursor):
+        cursor.execute("SHOW GLOBAL STATUS WHERE Variable_name IN ({})".format(
+            ", ".join(["%s"] * len(DB_STATUS_COUNTERS))), DB_STATUS_COUNTERS)
+        return {name: int(value) for name, value in cursor.fetchall()}
+
+
+class LoadTest:
+    def __init__(self, app, recorder, args):
+        self.app = app
+        self.recorder = recorder
+        self.args = args
+        self.latencies = {kind: [] for kind in POSTS_PER_EVENT}
+        self.timeouts = 0
+        self.evaluations_requested = 0
+        self._lock = threading.Lock()
+
+    def send(self, slack_user_id, kind, text):
+        channel = f"D{slack_user_id}"
+        expected = self.recorder.post_count(channel) + POSTS_PER_EVENT[kind]
+        body = {
+            "type": "event_callback", "team_id": "TLOADTEST", "api_app_id": "ALOADTEST",
+            "event_id": f"Ev{Xid().string()}", "event_time": int(time.time()),
+            "event": {"type": "message", "channel": channel, "channel_type": "im", "user": slack_user_id,
+                      "text": text, "ts": f"{time.time():.6f}"},
+        }
+
+        started = time.perf_counter()
+        self.app.dispatch(BoltRequest(body=body, mode="socket_mode"))
+        replied = self.recorder.wait_for(lambda: self.recorder.posts[channel] >= expected, self.args.reply_timeout)
+        latency = time.perf_counter() - started
+
+        with self._lock:
+            if replied:
+                self.latencies[kind].append(latency)
+            else:
+                self.timeouts += 1
+
+    def run_user(self, slack_user_id):
+        self.send(slack_user_id, "start", "!manual-start")
+        for turn in range(self.args.turns):
+            time.sleep(random.uniform(0, self.args.think_time))
+            self.send(slack_user_id, "turn", f"Turn {turn}: my teammate helped me a lot with the release this week.")
+
+        if random.random() < self.args.evaluate_ratio:
+            with self._lock:
+                self.evaluations_requested += 1
+            self.send(slack_user_id, "evaluate", "!manual-evaluate")
+
+
+def create_users(count):
+    from database import assume_user, insert_user, register_relation
+
+    slack_user_ids, user_ids = [], []
+    for index in range(count):
+        user_id = Xid().string()
+        slack_user_id = f"ULOAD{user_id.upper()}"
+        insert_user(user_id, f"loadtest-{index}", 0)
+        assume_user(slack_user_id, user_id)
+        if user_ids:
+            register_relation(user_id, user_ids[-1], "Colleague")
+        slack_user_ids.append(slack_user_id)
+        user_ids.append(user_id)
+    return slack_user_ids
+
+
+def report(load_test, recorder, elapsed, status_before, status_after, pool_before, pool_after, notified):
+    print(f"\n{load_test.args.users} users, {load_test.args.turns} turns each, {elapsed:.1f} s until the last reply")
+    events = 0
+    for kind, latencies in load_test.latencies.items():
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+        events += len(latencies_ms)
+        if latencies_ms:
+            print(f"{kind:<9} n={len(latencies_ms):<5} p50 {percentile(latencies_ms, 0.50):8.1f} ms  "
+                  f"p95 {percentile(latencies_ms, 0.95):8.1f} ms  p99 {percentile(latencies_ms, 0.99):8.1f} ms  "
+                  f"mean {statistics.mean(latencies_ms):8.1f} ms")
+    print(f"throughput {events / elapsed:.2f} events/s, {load_test.timeouts} events without a reply")
+    print(f"evaluations: {load_test.evaluations_requested} requested, {notified} notified")
+
+    # Server-wide counters: anything else using the database while the test runs is counted too
+    print("database:")
+    for name in DB_STATUS_COUNTERS:
+        delta = status_after.get(name, 0) - status_before.get(name, 0)
+        print(f"  {name:<12} {delta:8d}  {delta / max(events, 1):8.2f} per event")
+    borrows = pool_after["borrows"] - pool_before["borrows"]
+    print(f"  pool borrows {borrows:8d}  {borrows / max(events, 1):8.2f} per event, "
+          f"wait max {pool_after['wait_seconds_max'] * 1000:.1f} ms")
+    print(f"slack calls: {dict(recorder.calls)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5, help="Chat turns per session")
+    parser.add_argument("--rate", type=float, default=2.0, help="New sessions started per second")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Maximum pause in seconds between turns")
+    parser.add_argument("--evaluate-ratio", type=float, default=1.0, help="Share of users sending !manual-evaluate")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds the fake OpenAI takes per request")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="Random extra seconds per request")
+    parser.add_argument("--reply-timeout", type=float, default=60.0)
+    parser.add_argument("--drain-timeout", type=float, default=120.0,
+                        help="Seconds to wait for the evaluation workers after the last event")
+    args = parser.parse_args()
+
+    recorder = SlackRecorder()
+    port = start_fake_services(recorder, args.llm_latency, args.llm_jitter)
+
+    # Read at import time by gpt.py, commands.py and slack.py
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{port}/v1"
+    os.environ["OPENAI_API_KEY"] = "sk-loadtest"
+    os.environ["SLACK_API_BASE_URL"] = f"http://127.0.0.1:{port}/api/"
+    os.environ["SLACK_TOKEN"] = "xoxb-loadtest"
+    os.environ["STREAM_REPLIES"] = "false"
+
+    from database import db_cursor, get_pool_stats
+    from dispatch import user_dispatcher
+    from jobs import EvaluationWorkers
+    from sessions import feedback_sessions
+    from slack import app
+
+    slack_user_ids = create_users(args.users)
+    load_test = LoadTest(app, recorder, args)
+
+    workers = EvaluationWorkers(
+        lambda channel, thread_ts, text: app.client.chat_postMessage(channel=channel, thread_ts=thread_ts, text=text))
+    workers.start()
+
+    status_before, pool_before = db_status(db_cursor), get_pool_stats()
+    posts_before = recorder.total_posts()
+    started = time.perf_counter()
+
+    threads = []
+    for index, slack_user_id in enumerate(slack_user_ids):
+        delay = index / args.rate - (time.perf_counter() - started)
+        if delay > 0:
+            time.sleep(delay)
+        thread = threading.Thread(target=load_test.run_user, args=(slack_user_id,), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    events_elapsed = time.perf_counter() - started
+
+    # Each queued evaluation ends with one more post, in the thread of its !manual-evaluate
+    replies = sum(len(latencies) * POSTS_PER_EVENT[kind] for kind, latencies in load_test.latencies.items())
+    recorder.wait_for(lambda: recorder.total_posts() - posts_before >= replies + load_test.evaluations_requested,
+                      args.drain_timeout)
+    notified = recorder.total_posts() - posts_before - replies
+
+    workers.stop()
+    user_dispatcher.shutdown()
+    feedback_sessions.close()
+
+    report(load_test, recorder, events_elapsed, status_before, db_status(db_cursor), pool_before, get_pool_stats(), notified)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Microbenchmarks of the per-row evaluation mapping in database.py and the aggregations in service.py.
+
+Runs on synthetic Evaluation rows served by an in-memory cursor, so no database is needed.
+Run from the repository root:
+
+    python3 -m benchmarks.microbench                       # 1k and 100k rows
+    python3 -m benchmarks.microbench --sizes 1000000       # 1M rows needs a few GB of memory
+    python3 -m benchmarks.microbench --save                # record benchmarks/baselines.json
+    python3 -m benchmarks.microbench --compare             # fail on a regression against it
+    python3 -m benchmarks.microbench --check               # only run the edge case checks
+
+Commit the updated baselines.json together with a change that moves the numbers, so the
+difference shows up in review.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import database
+import service
+from evaluation_records import EVALUATION_COLUMNS, SCORE_COLUMNS
+from evaluation_specs import EVALUATION_TOPICS
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_SIZES = [1_000, 100_000]
+SENTIMENT_WORDS = ["helpful", "late", "kind", "busy", "clear", "stressed", "supportive", "vague"]
+
+
+class FakeConnection:
+    unread_result = False
+
+
+class FakeCursor:
+    """Serves pre-built rows the way a mysql-connector cursor does."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+        self.position = 0
+
+    def execute(self, query, values=None):
+        self.executed.append((query, values))
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchmany(self, size):
+        chunk = self.rows[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def fake_db(rows):
+    """Point database.db_cursor at a FakeCursor over rows for the duration of the block."""
+    real_db_cursor = database.db_cursor
+
+    @contextmanager
+    def fake_db_cursor():
+        yield FakeConnection(), FakeCursor(rows)
+
+    database.db_cursor = fake_db_cursor
+    try:
+        yield
+    finally:
+        database.db_cursor = real_db_cursor
+
+
+def synthetic_rows(count, seed=0):
+    """Evaluation rows in EVALUATION_COLUMNS order, with the types mysql-connector returns."""
+    rng = random.Random(seed)
+    started = datetime(2023, 7, 1)
+    rows = []
+    for index in range(count):
+        target_type = rng.choice((1, 2, 3))
+        topics = []
+        for topic in EVALUATION_TOPICS:
+            is_scored = topic.startswith("Company_") == (target_type == 1)
+            topics.append(rng.randint(0, 100) if is_scored else 0)
+            topics.append(Decimal(f"{rng.uniform(0, 1):.2f}") if is_scored else Decimal("0.00"))
+        sentiments = [{"word": word, "weight": round(rng.uniform(-1, 1), 2), "count": rng.randint(1, 5)}
+                      for word in rng.sample(SENTIMENT_WORDS, 4)]
+        rows.append((
+            f"ev{index:018d}", f"fbc{index // 3:017d}", target_type, "" if target_type != 3 else "Someone",
+            # TargetUserID is nullable, and some company evaluations leave it NULL
+            f"u{rng.randint(0, 999):019d}" if target_type == 2 else rng.choice(("", None)),
+            f"u{rng.randint(0, 999):019d}",
+            started + timedelta(minutes=index), *topics, json.dumps(sentiments),
+        ))
+    return rows
+
+
+def project(rows, columns, weights_as_double=False):
+    indexes = [EVALUATION_COLUMNS.index(column) for column in columns]
+    if weights_as_double:
+        return [tuple(float(row[index]) if isinstance(row[index], Decimal) else row[index] for index in indexes)
+                for row in rows]
+    return [tuple(row[index] for index in indexes) for row in rows]
+
+
+def benchmark_cases(rows):
+    """Name -> function to time, each working on the same rows."""
+    score_rows = project(rows, SCORE_COLUMNS)
+    # As evaluation_statistics reads them, with the weights cast to DOUBLE by MySQL
+    double_score_rows = project(rows, SCORE_COLUMNS, weights_as_double=True)
+    user_score_rows = project(rows, ["TargetUserID", *SCORE_COLUMNS], weights_as_double=True)
+    with fake_db(rows):
+        evaluations = database.get_evaluations_from_target_user_id_or_target_type(target_type=2)
+    with fake_db(score_rows):
+        score_evaluations = database.fetch_evaluations(SCORE_COLUMNS, target_type=2)
+    sentiment_columns = [row[-1] for row in rows]
+
+    def map_evaluations_by_target():
+        with fake_db(rows):
+            database.get_evaluations_from_target_user_id_or_target_type(target_type=2)
+
+    def map_evaluations_by_feedback():
+        with fake_db(rows):
+            database.get_evaluation_from_feedback_id("fbc")
+
+    def map_score_projection():
+        with fake_db(score_rows):
+            database.fetch_evaluations(SCORE_COLUMNS, target_type=2)
+
+    def parse_sentiment_data():
+        for sentiment_data in sentiment_columns:
+            json.loads(sentiment_data)
+
+    def calculate_average_scores():
+        service.calculate_average_scores(evaluations)
+
+    def calculate_average_scores_projected():
+        service.calculate_average_scores(score_evaluations)
+
+    def calculate_average_scores_streamed():
+        with fake_db(score_rows):
+            service.scan_average_scores(target_type=2)
+
+    def evaluation_statistics():
+        with fake_db(double_score_rows):
+            service.evaluation_statistics(target_type=2)
+
+    def evaluation_statistics_by_user():
+        with fake_db(user_score_rows):
+            service.evaluation_statistics(target_type=2, group_by='user')
+
+    return {
+        "database.get_evaluations_from_target_user_id_or_target_type": map_evaluations_by_target,
+        "database.get_evaluation_from_feedback_id": map_evaluations_by_feedback,
+        "database.fetch_evaluations(SCORE_COLUMNS)": map_score_projection,
+        "json.loads(SentimentData)": parse_sentiment_data,
+        "service.calculate_average_scores": calculate_average_scores,
+        "service.calculate_average_scores(SCORE_COLUMNS)": calculate_average_scores_projected,
+        "service.scan_average_scores": calculate_average_scores_streamed,
+        "service.evaluation_statistics": evaluation_statistics,
+        "service.evaluation_statistics(group_by=user)": evaluation_statistics_by_user,
+    }
+
+
+def check():
+    """Edge cases of the code benchmarked here, run before every benchmark."""
+    rows = synthetic_rows(300)
+    user_score_rows = project(rows, ["TargetUserID", *SCORE_COLUMNS], weights_as_double=True)
+    assert any(row[0] is None for row in user_score_rows)
+    with fake_db(user_score_rows):
+        by_user = service.evaluation_statistics(target_type=2, group_by='user')
+    assert None not in by_user and "" in by_user, "NULL TargetUserIDs group under ''"
+
+    sentiment_data = ["kind", {"word": "late"}, {"word": "vague", "count": "2", "weight": "0.5"},
+                      {"word": "busy", "count": "many", "weight": 0.5}, {"word": "clear", "count": 1, "weight": None}]
+    contributions = database.sentiment_word_contributions(
+        [{'EvaluationTargetType': 1, 'SentimentData': sentiment_data}])
+    assert contributions == {(database.ROLLUP_COMPANY, database.COMPANY_ROLLUP_KEY, "vague"): [2, 1.0]}, \
+        "malformed SentimentData entries are skipped, numeric strings coerced"
+
+
+def measure(func, rounds, warmup=1):
+    for _ in range(warmup):
+        func()
+    durations = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return {
+        "rounds": rounds,
+        "min": min(durations),
+        "median": statistics.median(durations),
+        "mean": statistics.mean(durations),
+        "stddev": statistics.stdev(durations) if rounds > 1 else 0.0,
+    }
+
+
+def peak_memory(func):
+    """Peak bytes allocated while func runs, including whatever it returns."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes, rounds):
+    results = {}
+    for size in sizes:
+        rows = synthetic_rows(size)
+        # Fewer rounds on the large datasets so a full run stays within minutes
+        size_rounds = max(3, min(rounds, rounds * 10_000 // size))
+        for name, func in benchmark_cases(rows).items():
+            result = measure(func, size_rounds)
+            result["per_row_us"] = result["median"] / size * 1e6
+            result["peak_mib"] = peak_memory(func) / 2 ** 20
+            results[f"{name}[{size}]"] = result
+            print(f"{name + f'[{size}]':<75} median {result['median'] * 1000:10.2f} ms  "
+                  f"min {result['min'] * 1000:10.2f} ms  {result['per_row_us']:7.3f} us/row  "
+                  f"peak {result['peak_mib']:8.1f} MiB", flush=True)
+        del rows
+    return results
+
+
+def compare(results, baselines, max_regression):
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            print(f"{name:<75} no baseline")
+            continue
+        change = result["median"] / baseline["median"] - 1
+        marker = "  REGRESSION" if change > max_regression else ""
+        print(f"{name:<75} {change * 100:+7.1f} %{marker}")
+        if marker:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        default=DEFAULT_SIZES, help="Comma separated row counts, e.g. 1000,100000,1000000")
+    parser.add_argument("--rounds", type=int, default=20, help="Timed rounds on the 1k dataset")
+    parser.add_argument("--save", action="store_true", help=f"Write the results to {BASELINES_PATH}")
+    parser.add_argument("--compare", action="store_true", help="Compare the medians with the saved baselines")
+    parser.add_argument("--check", action="store_true", help="Only run the edge case checks")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Slowdown of the median, as a fraction, that --compare fails on")
+    args = parser.parse_args()
+
+    check()
+    if args.check:
+        print("Checks passed.")
+        return
+
+    if args.compare and not os.path.exists(BASELINES_PATH):
+        sys.exit(f"No baselines to compare with at {BASELINES_PATH}, record them with --save first.")
+
+    results = run(args.sizes, args.rounds)
+
+    if args.compare:
+        with open(BASELINES_PATH) as file:
+            baselines = json.load(file)["benchmarks"]
+        print()
+        if compare(results, baselines, args.max_regression):
+            sys.exit(1)
+
+    if args.save:
+        baselines = {"machine": platform.platform(), "python": platform.python_version(), "benchmarks": {}}
+        if os.path.exists(BASELINES_PATH):
+            with open(BASELINES_PATH) as file:
+                baselines["benchmarks"] = json.load(file)["benchmarks"]
+        baselines["benchmarks"].update(results)
+        with open(BASELINES_PATH, "w") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+            file.write("\n")
+        print(f"Saved {len(results)} results to {BASELINES_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds.
+
+    on_evict(key, value) is called, outside the lock, for every entry that leaves the
+    cache by expiry, LRU eviction, replacement or pop.
+    """
+
+    def __init__(self, max_size, ttl, on_evict=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                evicted.append((key, self._entries.pop(key)[0]))
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+        self._notify(evicted)
+        return entry[0] if entry is not None else None
+
+    def put(self, key, value):
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None and previous[0] is not value:
+                evicted.append((key, previous[0]))
+
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_size:
+                evicted.append(self._pop_oldest())
+        self._notify(evicted)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._notify([(key, entry[0])])
+        return entry[0] if entry is not None else None
+
+    def pop_if(self, key, predicate):
+        """Pop the entry only if predicate(value) holds, checked under the lock."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not predicate(entry[0]):
+                return None
+            del self._entries[key]
+        self._notify([(key, entry[0])])
+        return entry[0]
+
+    def peek(self, key):
+        """The cached value, without counting a hit or miss or refreshing its LRU position."""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def evict_expired(self):
+        evicted = []
+        now = time.monotonic()
+        with self._lock:
+            for key, (_, expires_at) in list(self._entries.items()):
+                if expires_at < now:
+                    evicted.append((key, self._entries.pop(key)[0]))
+        self._notify(evicted)
+
+    def clear(self):
+        with self._lock:
+            evicted = [(key, value) for key, (value, _) in self._entries.items()]
+            self._entries.clear()
+        self._notify(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _pop_oldest(self):
+        key, (value, _) = self._entries.popitem(last=False)
+        return key, value
+
+    def _notify(self, evicted):
+        if self.on_evict:
+            for key, value in evicted:
+                self.on_evict(key, value)
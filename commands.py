@@ -0,0 +1,53 @@
+import os
+
+CMD_CREATE_USER = "!create-user"
+CMD_WHO_AM_I = "!who-am-i"
+CMD_ASSUME_USER = "!assume-user"
+CMD_MANUAL_START = "!manual-start"
+CMD_MANUAL_CALCULATE = "!manual-evaluate"
+CMD_GET_CURRENT_FEEDBACK_ID = "!get-current-feedback-id"
+CMD_GET_EVALUATION = "!get-evaluation"
+CMD_SET_RELATION = "!set-relation"
+CMD_HELP = "!help"
+
+MANUAL = """```
+1. !create-user
+This command allows you to create a new user. You can use it by simply typing `!create-user your_user_name`. The server will generate a unique user ID and associate it with the given user name.
+
+2. !who-am-i
+This command gives you information about your user. When you send `!who-am-i`, it will return your user ID, name, and all your relations.
+
+3. !assume-user
+This command lets you assume the identity of a user you've previously created. Use `!assume-user your_user_id`. The server will associate your Slack account with the ID of the user you've entered.
+
+4. !set-relation
+This command enables you to register a relationship between two users. Use `!set-relation user_id relation_type`. The server will establish a relation of 'relation_type' between 'current_user' and 'user_id'.
+
+5. !manual-start
+The `!manual-start` command starts a feedback session. The feedback session allows you to give feedback for other users you're related to. Before using this command, make sure you've created and assumed a user.
+
+6. !manual-evaluate
+This command calculates evaluations based on the feedback provided. Use `!manual-evaluate` to queue the evaluation, Wevo replies in the thread once each feedback has been evaluated. Identical evaluations are answered from a cache, use `!manual-evaluate force` to ask the model again.
+
+7. !get-current-feedback-id
+NOT YET IMPLEMENTED
+
+8. !get-evaluation
+The `!get-evaluation` command allows you to retrieve evaluations. You can use it in these ways:
+- `!get-evaluation company` to get an evaluation of the entire company (summarized).
+- `!get-evaluation user user_id` to get an evaluation for a specific user (summarized).
+- `!get-evaluation feedback feedback_id` to get an evaluation of a specific feedback.
+- `!get-evaluation stats company` or `!get-evaluation stats user user_id` to get the mean, spread, count and percentiles of each score, add `day` or `week` to get them per day or week.
+- `!get-evaluation stats users` to get those statistics for every user.
+- `!get-evaluation trend company` or `!get-evaluation trend user user_id` to get the weekly scores of the last 12 weeks, add `day` for daily scores or a topic such as `Person_Trust` for that topic only.
+- `!get-evaluation words company` or `!get-evaluation words user user_id` to get the most positive and most negative words of the feedbacks.
+- `!get-evaluation` to get an evaluation for the current user.
+Each command will return a structured JSON response with the corresponding evaluations.
+```"""
+
+# Post replies while they are generated, editing one message at most once per interval (chat.update is rate limited)
+STREAM_REPLIES = os.getenv('STREAM_REPLIES', 'true') == 'true'
+STREAM_UPDATE_INTERVAL_SECONDS = float(os.getenv('STREAM_UPDATE_INTERVAL_SECONDS', '1.0'))
+STREAM_PLACEHOLDER = "..."
+# Replaces the placeholder when a streamed reply fails before its first part
+STREAM_FAILED_MESSAGE = "Sorry, I could not reply to that. Please try again."
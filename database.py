@@ -1,31 +1,174 @@
+import asyncio
+import contextvars
+import functools
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 import mysql.connector
+from mysql.connector import pooling
 from xid import Xid
 
-# Initialize MySQL connection
-db = mysql.connector.connect(
-    host=os.getenv('DB_HOST'),
-    port="3306",
-    user=os.getenv("DB_USER"),
-    password=os.getenv('DB_PASSWORD'),
-    database="wevo"
-)
-
-cursor = db.cursor()
+from cache import TTLCache
+from evaluation_records import EVALUATION_COLUMNS, SCORE_COLUMNS, WEIGHT_COLUMNS, EvaluationRecord, validate_columns
+from evaluation_specs import EVALUATION_TOPICS
+from metrics import db_timed, DB_QUERY_SECONDS, ERRORS
+from tracing import TracedCursor, is_enabled as is_tracing_enabled
+from tokens import message_tokens
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+DB_RECONNECT_ATTEMPTS = int(os.getenv('DB_RECONNECT_ATTEMPTS', '3'))
+DB_RECONNECT_DELAY = int(os.getenv('DB_RECONNECT_DELAY', '1'))
+
+ROLLUP_COMPANY = 'company'
+ROLLUP_USER = 'user'
+ROLLUP_NAME = 'name'
+# Evaluations do not record a company, so everything rolls up to the single seeded company
+COMPANY_ROLLUP_KEY = '0'
+
+# Bucket sizes of EvaluationTrendRollup
+TREND_DAY = 'day'
+TREND_WEEK = 'week'
+TREND_BUCKETS = (TREND_DAY, TREND_WEEK)
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '10000'))
+# Old responses are evicted every this many writes, so the cache can briefly hold that many more entries
+LLM_CACHE_EVICT_EVERY = max(1, int(os.getenv('LLM_CACHE_EVICT_EVERY', '100')))
+
+# Rows fetched per round trip when streaming evaluations
+EVALUATION_FETCH_CHUNK_SIZE = int(os.getenv('EVALUATION_FETCH_CHUNK_SIZE', '1000'))
+
+# Words returned per polarity by get_sentiment_words
+SENTIMENT_WORDS_LIMIT = int(os.getenv('SENTIMENT_WORDS_LIMIT', '10'))
+
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '1000'))
+# Other processes' writes to users and relations become visible after at most this long
+USER_CACHE_TTL_SECONDS = int(os.getenv('USER_CACHE_TTL_SECONDS', '300'))
+
+# Connections are created lazily on first use and shared by every thread through the pool
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+
+# mysql-connector has no asyncio driver, so async callers run queries on one thread per pooled connection
+_db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="wevo-db")
+
+_llm_cache_writes = 0
+_llm_cache_writes_lock = threading.Lock()
+
+_pool_stats = {
+    "borrows": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+}
+_pool_stats_lock = threading.Lock()
+
+# Slack ID -> (user ID, user name) and user ID -> relations, read on every message
+_slack_user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+_relations_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pooling.MySQLConnectionPool(
+                pool_name="wevo",
+                pool_size=DB_POOL_SIZE,
+                host=os.getenv('DB_HOST'),
+                port="3306",
+                user=os.getenv("DB_USER"),
+                password=os.getenv('DB_PASSWORD'),
+                database="wevo"
+            )
+        return _pool
+
+
+def _record_borrow_wait(waited):
+    with _pool_stats_lock:
+        _pool_stats["borrows"] += 1
+        _pool_stats["wait_seconds_total"] += waited
+        _pool_stats["wait_seconds_max"] = max(_pool_stats["wait_seconds_max"], waited)
+
+
+def get_pool_stats():
+    with _pool_stats_lock:
+        stats = dict(_pool_stats)
+    stats["pool_size"] = DB_POOL_SIZE
+    stats["wait_seconds_avg"] = stats["wait_seconds_total"] / stats["borrows"] if stats["borrows"] else 0.0
+    return stats
+
+
+def get_user_cache_stats():
+    return {"slack_users": _slack_user_cache.stats(), "relations": _relations_cache.stats()}
+
+
+@contextmanager
+def db_cursor():
+    """Borrow a pooled connection and a fresh cursor for the duration of the block.
+
+    Blocks while all connections are in use, and pings the borrowed connection so
+    a connection dropped by the server is reconnected before the query runs.
+    """
+    started = time.monotonic()
+    _pool_slots.acquire()
+    _record_borrow_wait(time.monotonic() - started)
+    try:
+        conn = _get_pool().get_connection()
+        try:
+            conn.ping(reconnect=True, attempts=DB_RECONNECT_ATTEMPTS, delay=DB_RECONNECT_DELAY)
+            cursor = conn.cursor()
+            if is_tracing_enabled():
+                cursor = TracedCursor(cursor)
+            try:
+                yield conn, cursor
+            except mysql.connector.Error:
+                ERRORS.labels("db").inc()
+                raise
+            finally:
+                cursor.close()
+        finally:
+            # Returns the connection to the pool rather than closing it
+            conn.close()
+    finally:
+        _pool_slots.release()
+
+
+async def run_db(func, *args, **kwargs):
+    """Await a blocking database function without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    # Run in a copy of the caller's context so its trace span stays the parent
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_db_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+USER_FROM_SLACK_QUERY = """
+    SELECT Users.ID, Users.Name
+    FROM SlackUsers
+    JOIN Users ON SlackUsers.UserID = Users.ID
+    WHERE SlackUsers.ID = %s
+"""
+
+
+# Cache hits are not timed, so wevo_db_query_seconds only holds queries that reached the database
+@db_timed("get_user_info_from_slack")
+def fetch_user_from_slack(slack_user_id):
+    with db_cursor() as (_, cursor):
+        cursor.execute(USER_FROM_SLACK_QUERY, (slack_user_id,))
+        return cursor.fetchone()
 
 
 def get_user_info_from_slack(slack_user_id, get_relations=False):
-    query = """
-        SELECT Users.ID, Users.Name
-        FROM SlackUsers
-        JOIN Users ON SlackUsers.UserID = Users.ID
-        WHERE SlackUsers.ID = %s
-    """
-    cursor.execute(query, (slack_user_id,))
-    result = cursor.fetchone()
+    result = _slack_user_cache.get(slack_user_id)
+    if result is None:
+        result = fetch_user_from_slack(slack_user_id)
+        # Unknown Slack users are not cached, they are expected to assume a user next
+        if result:
+            _slack_user_cache.put(slack_user_id, result)
 
     if result:
         user_id, user_name = result[0], result[1]
@@ -38,14 +181,18 @@ def get_user_info_from_slack(slack_user_id, get_relations=False):
         return None, None, []
 
 
+USER_QUERY = """
+    SELECT Users.ID, Users.Name
+    FROM Users
+    WHERE Users.ID = %s
+"""
+
+
+@db_timed()
 def get_user_info(user_id, get_relations=False):
-    query = """
-        SELECT Users.ID, Users.Name
-        FROM Users
-        WHERE Users.ID = %s
-    """
-    cursor.execute(query, (user_id,))
-    result = cursor.fetchone()
+    with db_cursor() as (_, cursor):
+        cursor.execute(USER_QUERY, (user_id,))
+        result = cursor.fetchone()
 
     if result:
         user_id, user_name = result[0], result[1]
@@ -58,40 +205,58 @@ def get_user_info(user_id, get_relations=False):
         return None, None, []
 
 
+USER_RELATIONS_QUERY = """
+    (SELECT UserRelations.UserID2 as UserID, Users.Name, UserRelations.Relationship
+    FROM UserRelations
+    JOIN Users ON UserRelations.UserID2 = Users.ID
+    WHERE UserRelations.UserID1 = %s)
+    UNION ALL
+    (SELECT UserRelations.UserID1 as UserID, Users.Name, UserRelations.Relationship
+    FROM UserRelations
+    JOIN Users ON UserRelations.UserID1 = Users.ID
+    WHERE UserRelations.UserID2 = %s)
+"""
+
+
+@db_timed("get_user_relations")
+def fetch_user_relations(user_id):
+    with db_cursor() as (_, cursor):
+        cursor.execute(USER_RELATIONS_QUERY, (user_id, user_id))
+        return cursor.fetchall()
+
+
 def get_user_relations(user_id):
-    relations_query = """
-        (SELECT UserRelations.UserID2 as UserID, Users.Name, UserRelations.Relationship
-        FROM UserRelations
-        JOIN Users ON UserRelations.UserID2 = Users.ID
-        WHERE UserRelations.UserID1 = %s)
-        UNION ALL
-        (SELECT UserRelations.UserID1 as UserID, Users.Name, UserRelations.Relationship
-        FROM UserRelations
-        JOIN Users ON UserRelations.UserID1 = Users.ID
-        WHERE UserRelations.UserID2 = %s)
-    """
-    cursor.execute(relations_query, (user_id, user_id))
-    relations = cursor.fetchall()
+    relations_info = _relations_cache.get(user_id)
+    if relations_info is not None:
+        return [dict(relation) for relation in relations_info]
+
+    relations = fetch_user_relations(user_id)
 
     relations_info = []
     for relation in relations:
         target_user_id, target_user_name, relationship = relation
         relations_info.append({"UserID": target_user_id, "UserName": target_user_name, "Relationship": relationship})
 
-    return relations_info
+    _relations_cache.put(user_id, relations_info)
+    return [dict(relation) for relation in relations_info]
 
 
+@db_timed()
 def insert_user(user_id, name, company_id):
     query = "INSERT INTO Users (ID, Name, CompanyID) VALUES (%s, %s, %s)"
     values = (user_id, name, company_id)
     try:
-        cursor.execute(query, values)
-        db.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, values)
+            conn.commit()
+        # An empty relations list may have been cached while the user did not exist yet
+        _relations_cache.pop(user_id)
         print(f"User {name} added successfully.")
     except mysql.connector.Error as error:
         print("Failed to insert data into MySQL table {}".format(error))
 
 
+@db_timed()
 def assume_user(slack_id, user_id):
     query = """
         INSERT INTO SlackUsers (ID, UserID)
@@ -100,41 +265,118 @@ def assume_user(slack_id, user_id):
     """
     values = (slack_id, user_id, user_id)
     try:
-        cursor.execute(query, values)
-        db.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, values)
+            conn.commit()
+        _slack_user_cache.pop(slack_id)
         print(f"SlackID {slack_id} associated with UserID {user_id} successfully.")
     except mysql.connector.Error as error:
         print("Failed to insert/update data in MySQL table {}".format(error))
 
 
-def insert_feedback(user_id, feedback_data):
+@db_timed()
+def insert_feedback(user_id, feedback_data, token_counts):
     gen_id = "fbc" + Xid().string()
-    query = "INSERT INTO Feedback (ID, UserID, Timestamp, Data) VALUES (%s, %s, %s, %s)"
-    values = (gen_id, user_id, datetime.now(), json.dumps(feedback_data))
+    query = "INSERT INTO Feedback (ID, UserID, Timestamp, Version) VALUES (%s, %s, %s, %s)"
+    values = (gen_id, user_id, datetime.now(), len(feedback_data))
     try:
-        cursor.execute(query, values)
-        db.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, values)
+            insert_feedback_messages(cursor, gen_id, 0, feedback_data, token_counts)
+            conn.commit()
         print(f"Feedback added successfully.")
         return gen_id
     except mysql.connector.Error as error:
         print("Failed to insert data into MySQL table {}".format(error))
 
 
-def get_feedback(user_id):
-    date_threshold = datetime.now() - timedelta(days=2)
+def insert_feedback_messages(cursor, feedback_id, start_seq, messages, token_counts):
+    query = """
+        INSERT INTO FeedbackMessages (FeedbackID, Seq, Role, Content, TokenCount)
+        VALUES (%s, %s, %s, %s, %s)
+    """
+    values = [
+        (feedback_id, seq, message["role"], message["content"], token_count)
+        for seq, (message, token_count) in enumerate(zip(messages, token_counts), start=start_seq)
+    ]
+    if values:
+        cursor.executemany(query, values)
 
+
+@db_timed()
+def append_feedback_messages(feedback_id, version, messages, token_counts):
+    """Append the messages of one turn to a feedback last read at the given version.
+
+    The version is the number of stored messages. Returns the new version, or None
+    when another turn has written to the feedback since it was read.
+    """
     query = """
-        SELECT ID, UserID, TargetUserID, Timestamp, Data, IsCalculated FROM Feedback
-        WHERE UserID = %s AND Timestamp >= %s AND IsCalculated = FALSE
-        ORDER BY Timestamp DESC
-        LIMIT 1
+        UPDATE Feedback
+        SET Version = Version + %s
+        WHERE ID = %s AND Version = %s
     """
 
+    values = (len(messages), feedback_id, version)
+
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, values)
+            if cursor.rowcount != 1:
+                conn.rollback()
+                print(f"Feedback ID {feedback_id} has changed since version {version}.")
+                return None
+
+            insert_feedback_messages(cursor, feedback_id, version, messages, token_counts)
+            conn.commit()
+        print(f"{len(messages)} messages appended to feedback ID {feedback_id}.")
+        return version + len(messages)
+    except mysql.connector.Error as error:
+        print(f"Failed to append feedback messages into MySQL table: {error}")
+
+
+FEEDBACK_MESSAGES_QUERY = """
+    SELECT FeedbackID, Role, Content, TokenCount FROM FeedbackMessages
+    WHERE FeedbackID IN ({placeholders})
+    ORDER BY FeedbackID, Seq
+"""
+
+
+def fetch_feedback_messages(cursor, feedback_ids):
+    """Return {feedback_id: (messages, token_counts)} for the given feedbacks."""
+    messages = {feedback_id: ([], []) for feedback_id in feedback_ids}
+    if not feedback_ids:
+        return messages
+
+    placeholders = ", ".join(["%s"] * len(feedback_ids))
+    cursor.execute(FEEDBACK_MESSAGES_QUERY.format(placeholders=placeholders), tuple(feedback_ids))
+
+    for feedback_id, role, content, token_count in cursor.fetchall():
+        message = {"role": role, "content": content}
+        messages[feedback_id][0].append(message)
+        # Rows stored before TokenCount existed are estimated on read
+        messages[feedback_id][1].append(token_count if token_count is not None else message_tokens(message))
+    return messages
+
+
+RECENT_FEEDBACK_QUERY = """
+    SELECT ID, UserID, TargetUserID, Timestamp, IsCalculated, Version FROM Feedback
+    WHERE UserID = %s AND Timestamp >= %s AND IsCalculated = FALSE
+    ORDER BY Timestamp DESC
+    LIMIT 1
+"""
+
+
+@db_timed()
+def get_feedback(user_id):
+    date_threshold = datetime.now() - timedelta(days=2)
+
     values = (user_id, date_threshold)
 
     try:
-        cursor.execute(query, values)
-        feedback_row = cursor.fetchone()
+        with db_cursor() as (_, cursor):
+            cursor.execute(RECENT_FEEDBACK_QUERY, values)
+            feedback_row = cursor.fetchone()
+            messages = fetch_feedback_messages(cursor, [feedback_row[0]]) if feedback_row else {}
 
         if feedback_row:
             feedback = {
@@ -142,10 +384,12 @@ def get_feedback(user_id):
                 'UserID': feedback_row[1],
                 'TargetUserID': feedback_row[2],
                 'Timestamp': feedback_row[3],
-                'Data': json.loads(feedback_row[4]),
-                'IsCalculated': feedback_row[5]
+                'Data': messages[feedback_row[0]][0],
+                'TokenCounts': messages[feedback_row[0]][1],
+                'IsCalculated': feedback_row[4],
+                'Version': feedback_row[5]
             }
-            print(f"Feedback found: {feedback}")
+            print(f"Feedback found: {feedback['ID']} at version {feedback['Version']}")
             return feedback
         else:
             print("No recent uncalculated feedback found for this user.")
@@ -154,6 +398,39 @@ def get_feedback(user_id):
         print("Failed to fetch data from MySQL table {}".format(error))
 
 
+FEEDBACK_BY_ID_QUERY = """
+    SELECT ID, UserID, TargetUserID, Timestamp, IsCalculated, Version FROM Feedback
+    WHERE ID = %s
+"""
+
+
+@db_timed()
+def get_feedback_by_id(feedback_id):
+    try:
+        with db_cursor() as (_, cursor):
+            cursor.execute(FEEDBACK_BY_ID_QUERY, (feedback_id,))
+            feedback_row = cursor.fetchone()
+            messages = fetch_feedback_messages(cursor, [feedback_id]) if feedback_row else {}
+
+        if feedback_row:
+            return {
+                'ID': feedback_row[0],
+                'UserID': feedback_row[1],
+                'TargetUserID': feedback_row[2],
+                'Timestamp': feedback_row[3],
+                'Data': messages[feedback_id][0],
+                'TokenCounts': messages[feedback_id][1],
+                'IsCalculated': feedback_row[4],
+                'Version': feedback_row[5]
+            }
+        else:
+            print(f"Feedback ID {feedback_id} not found.")
+            return None
+    except mysql.connector.Error as error:
+        print("Failed to fetch data from MySQL table {}".format(error))
+
+
+@db_timed()
 def mark_feedback_as_calculated(feedback_id):
     query = """
         UPDATE Feedback
@@ -164,362 +441,689 @@ def mark_feedback_as_calculated(feedback_id):
     values = (feedback_id,)
 
     try:
-        cursor.execute(query, values)
-        db.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, values)
+            conn.commit()
         print(f"Feedback ID {feedback_id} has been marked as calculated.")
     except mysql.connector.Error as error:
         print("Failed to update data in MySQL table: {}".format(error))
 
 
-def get_uncalculated_feedbacks(user_id):
-    date_threshold = datetime.now() - timedelta(days=2)
+UNCALCULATED_FEEDBACK_IDS_QUERY = """
+    SELECT ID FROM Feedback
+    WHERE UserID = %s AND Timestamp >= %s AND IsCalculated = FALSE
+    ORDER BY Timestamp DESC
+"""
 
-    query = """
-        SELECT ID, UserID, TargetUserID, Timestamp, Data, IsCalculated FROM Feedback
-        WHERE UserID = %s AND Timestamp >= %s AND IsCalculated = FALSE
-        ORDER BY Timestamp DESC
-    """
+
+@db_timed()
+def get_uncalculated_feedback_ids(user_id):
+    """IDs of the user's recent uncalculated feedbacks, the workers load their messages when evaluating them."""
+    date_threshold = datetime.now() - timedelta(days=2)
 
     values = (user_id, date_threshold)
 
     try:
-        cursor.execute(query, values)
-        feedback_rows = cursor.fetchall()
-
-        if feedback_rows:
-            feedbacks = []
-            for row in feedback_rows:
-                feedback = {
-                    'ID': row[0],
-                    'UserID': row[1],
-                    'TargetUserID': row[2],
-                    'Timestamp': row[3],
-                    'Data': json.loads(row[4]),
-                    'IsCalculated': row[5]
-                }
-                feedbacks.append(feedback)
+        with db_cursor() as (_, cursor):
+            cursor.execute(UNCALCULATED_FEEDBACK_IDS_QUERY, values)
+            feedback_ids = [row[0] for row in cursor.fetchall()]
 
-            print(f"Feedbacks found: {feedbacks}")
-            return feedbacks
+        if feedback_ids:
+            print(f"Feedbacks found: {feedback_ids}")
         else:
             print("No recent uncalculated feedbacks found for this user.")
-            return None
+        return feedback_ids
     except mysql.connector.Error as error:
         print("Failed to fetch data from MySQL table {}".format(error))
 
 
-def update_feedback_data(user_id, new_feedback_data):
-    # First get the feedback we want to update
-    feedback = get_feedback(user_id)
+INSERT_EVALUATION_QUERY = "INSERT INTO Evaluation ({}) VALUES ({})".format(
+    ", ".join(EVALUATION_COLUMNS), ", ".join(["%s"] * len(EVALUATION_COLUMNS)))
+
+
+def evaluation_values(user_id, feedback_id, evaluation, timestamp):
+    """Values in EVALUATION_COLUMNS order for one evaluation as returned by the model."""
+    return (
+        Xid().string(),
+        feedback_id,
+        evaluation.get('EvaluationTargetType', None),
+        evaluation.get('SubjectName', ""),
+        evaluation.get('SubjectUserID', ""),
+        user_id,
+        timestamp,
+        *(evaluation.get(column, 0) for column in SCORE_COLUMNS),
+        json.dumps(evaluation.get('SentimentData', []))
+    )
+
+
+@db_timed()
+def insert_evaluation(user_id, feedback_id, evaluation):
+    try:
+        timestamp = datetime.now()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(INSERT_EVALUATION_QUERY, evaluation_values(user_id, feedback_id, evaluation, timestamp))
+            update_evaluation_rollup(cursor, [evaluation])
+            update_evaluation_trends(cursor, [evaluation], timestamp)
+            update_sentiment_word_index(cursor, [evaluation])
+            conn.commit()
+    except mysql.connector.Error as error:
+        print(f"Failed to insert evaluation into MySQL table: {error}")
 
-    # If no feedback was found, return None
-    if feedback is None:
-        print("No feedback found for this user.")
-        return
 
-    # If a feedback was found, update its text
+@db_timed()
+def insert_evaluations(user_id, feedback_id, evaluations):
+    """Store all evaluations of one feedback, their rollups, sentiment words and the feedback's IsCalculated flag
+    in a single transaction.
+
+    Returns False, writing nothing, when the feedback had already been calculated, e.g. by another worker.
+    """
     query = """
         UPDATE Feedback
-        SET Data = %s
-        WHERE ID = %s
+        SET IsCalculated = TRUE
+        WHERE ID = %s AND IsCalculated = FALSE
     """
 
-    values = (json.dumps(new_feedback_data), feedback["ID"])
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, (feedback_id,))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                print(f"Feedback ID {feedback_id} has already been calculated.")
+                return False
+
+            if evaluations:
+                timestamp = datetime.now()
+                cursor.executemany(INSERT_EVALUATION_QUERY, [
+                    evaluation_values(user_id, feedback_id, evaluation, timestamp) for evaluation in evaluations
+                ])
+                update_evaluation_rollup(cursor, evaluations)
+                update_evaluation_trends(cursor, evaluations, timestamp)
+                update_sentiment_word_index(cursor, evaluations)
+            conn.commit()
+        print(f"{len(evaluations)} evaluations of feedback ID {feedback_id} have been inserted.")
+        return True
+    except mysql.connector.Error as error:
+        print(f"Failed to insert evaluations into MySQL table: {error}")
+        raise
+
+
+def rollup_targets(evaluation):
+    targets = []
+    if evaluation.get('EvaluationTargetType') == 1:
+        targets.append((ROLLUP_COMPANY, COMPANY_ROLLUP_KEY))
+    if evaluation.get('SubjectUserID'):
+        targets.append((ROLLUP_USER, evaluation['SubjectUserID']))
+    if evaluation.get('EvaluationTargetType') == 3 and evaluation.get('SubjectName'):
+        targets.append((ROLLUP_NAME, evaluation['SubjectName']))
+    return targets
+
+
+def topic_contributions(evaluation):
+    contributions = []
+    for topic in EVALUATION_TOPICS:
+        score = evaluation.get(topic, 0)
+        weight = evaluation.get(f'{topic}Weight', 0)
+        if score is None or weight is None:
+            continue
+        try:
+            # Model output may hold numbers as strings, which MySQL coerces the same way when storing them.
+            # Round the same way the INT and DECIMAL(5, 2) Evaluation columns do, so a rebuild gives the same sums
+            score, weight = round(float(score)), round(float(weight), 2)
+        except (TypeError, ValueError, OverflowError):
+            continue
+        contributions.append((topic, score * weight, weight))
+    return contributions
+
+
+def update_evaluation_rollup(cursor, evaluations):
+    """Add the evaluations to the rollup of every target they count towards, on the caller's transaction."""
+    query = """
+        INSERT INTO EvaluationRollup (TargetKind, TargetKey, Topic, WeightedScoreSum, WeightSum)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            WeightedScoreSum = WeightedScoreSum + VALUES(WeightedScoreSum),
+            WeightSum = WeightSum + VALUES(WeightSum)
+    """
+
+    totals = {}
+    for evaluation in evaluations:
+        for kind, key in rollup_targets(evaluation):
+            for topic, weighted_score, weight in topic_contributions(evaluation):
+                sums = totals.setdefault((kind, key, topic), [0, 0])
+                sums[0] += weighted_score
+                sums[1] += weight
+    if totals:
+        # Sorted like the trend and sentiment upserts, so concurrent transactions lock the rows in the same order
+        cursor.executemany(query, [(*target, weighted_score, weight)
+                                   for target, (weighted_score, weight) in sorted(totals.items())])
+
+
+def trend_bucket_start(timestamp, bucket_size):
+    """First day of the day or week (starting Monday) bucket the timestamp falls in."""
+    day = timestamp.date()
+    if bucket_size == TREND_WEEK:
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def update_evaluation_trends(cursor, evaluations, timestamp):
+    """Add the evaluations, stored with timestamp, to the day and week buckets of every target they count towards."""
+    query = """
+        INSERT INTO EvaluationTrendRollup
+            (TargetKind, TargetKey, BucketSize, BucketStart, Topic, WeightedScoreSum, WeightSum)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            WeightedScoreSum = WeightedScoreSum + VALUES(WeightedScoreSum),
+            WeightSum = WeightSum + VALUES(WeightSum)
+    """
+
+    totals = {}
+    for evaluation in evaluations:
+        for kind, key in rollup_targets(evaluation):
+            for topic, weighted_score, weight in topic_contributions(evaluation):
+                for bucket_size in TREND_BUCKETS:
+                    sums = totals.setdefault(
+                        (kind, key, bucket_size, trend_bucket_start(timestamp, bucket_size), topic), [0, 0])
+                    sums[0] += weighted_score
+                    sums[1] += weight
+    if totals:
+        # Summed per bucket first, since a feedback's evaluations usually share their targets' buckets
+        cursor.executemany(query, [(*bucket, weighted_score, weight)
+                                   for bucket, (weighted_score, weight) in sorted(totals.items())])
+
+
+SENTIMENT_WORD_MAX_LENGTH = 64
+
+
+def sentiment_word_contributions(evaluations):
+    """(target kind, target key, word) -> [count, weighted polarity] of the SentimentData of the evaluations."""
+    contributions = {}
+    for evaluation in evaluations:
+        targets = rollup_targets(evaluation)
+        for sentiment in evaluation.get('SentimentData') or []:
+            # SentimentData is the model's JSON, so skip entries that are not a dict of a word and numbers
+            if not isinstance(sentiment, dict):
+                continue
+            word = str(sentiment.get('word') or '').strip().lower()[:SENTIMENT_WORD_MAX_LENGTH]
+            try:
+                count = int(sentiment.get('count') or 0)
+                weight = float(sentiment['weight'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if not word or count <= 0:
+                continue
+            for kind, key in targets:
+                totals = contributions.setdefault((kind, key, word), [0, 0])
+                totals[0] += count
+                # Rounded like the model's two decimal weights, so a rebuild gives the same sums
+                totals[1] += round(weight, 2) * count
+    return contributions
+
+
+SENTIMENT_WORD_UPSERT_QUERY = """
+    INSERT INTO SentimentWordIndex (TargetKind, TargetKey, Word, WordCount, WeightedPolarity)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        WordCount = WordCount + VALUES(WordCount),
+        WeightedPolarity = WeightedPolarity + VALUES(WeightedPolarity)
+"""
+
+
+def update_sentiment_word_index(cursor, evaluations):
+    """Add the sentiment words of the evaluations to the index of every target, on the caller's transaction."""
+    values = [
+        (kind, key, word, count, polarity)
+        # Sorted, so concurrent transactions lock the index rows in the same order
+        for (kind, key, word), (count, polarity) in sorted(sentiment_word_contributions(evaluations).items())
+    ]
+    if values:
+        cursor.executemany(SENTIMENT_WORD_UPSERT_QUERY, values)
+
+
+@db_timed()
+def rebuild_evaluation_rollup():
+    # Same target rules as rollup_targets, expressed over the stored Evaluation rows
+    target_selectors = [
+        (f"'{ROLLUP_COMPANY}'", f"'{COMPANY_ROLLUP_KEY}'", "EvaluationTargetType = 1"),
+        (f"'{ROLLUP_USER}'", "TargetUserID", "TargetUserID IS NOT NULL AND TargetUserID <> ''"),
+        (f"'{ROLLUP_NAME}'", "TargetUserName",
+         "EvaluationTargetType = 3 AND TargetUserName IS NOT NULL AND TargetUserName <> ''"),
+    ]
+
+    # Same buckets as trend_bucket_start
+    bucket_starts = [
+        (f"'{TREND_DAY}'", "DATE(Timestamp)"),
+        (f"'{TREND_WEEK}'", "DATE(Timestamp) - INTERVAL WEEKDAY(Timestamp) DAY"),
+    ]
+
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute("DELETE FROM EvaluationRollup")
+            cursor.execute("DELETE FROM EvaluationTrendRollup")
+            for kind, key, condition in target_selectors:
+                for topic in EVALUATION_TOPICS:
+                    cursor.execute(f"""
+                        INSERT INTO EvaluationRollup (TargetKind, TargetKey, Topic, WeightedScoreSum, WeightSum)
+                        SELECT {kind}, {key}, '{topic}',
+                            SUM({topic} * {topic}Weight),
+                            SUM(IF({topic} IS NULL, NULL, {topic}Weight))
+                        FROM Evaluation
+                        WHERE {condition}
+                        GROUP BY 1, 2
+                    """)
+                    for bucket_size, bucket_start in bucket_starts:
+                        cursor.execute(f"""
+                            INSERT INTO EvaluationTrendRollup
+                                (TargetKind, TargetKey, BucketSize, BucketStart, Topic, WeightedScoreSum, WeightSum)
+                            SELECT {kind}, {key}, {bucket_size}, {bucket_start}, '{topic}',
+                                SUM({topic} * {topic}Weight),
+                                SUM(IF({topic} IS NULL, NULL, {topic}Weight))
+                            FROM Evaluation
+                            WHERE {condition}
+                            GROUP BY 1, 2, 4
+                        """)
+            conn.commit()
+        print("Evaluation rollup has been rebuilt.")
+    except mysql.connector.Error as error:
+        print(f"Failed to rebuild evaluation rollup: {error}")
+
+
+@db_timed()
+def rebuild_sentiment_word_index():
+    columns = ["EvaluationTargetType", "TargetUserID", "TargetUserName", "SentimentData"]
+
+    def stored_evaluations():
+        # Every type: rollup_targets indexes any evaluation with a SubjectUserID, whatever its type
+        for rows in iter_evaluation_chunks(columns, all_evaluations=True):
+            for evaluation_type, target_user_id, target_user_name, sentiment_data in rows:
+                # In the shape the model returns evaluations, which rollup_targets reads
+                yield {
+                    'EvaluationTargetType': evaluation_type,
+                    'SubjectUserID': target_user_id,
+                    'SubjectName': target_user_name,
+                    'SentimentData': json.loads(sentiment_data) if sentiment_data else [],
+                }
 
     try:
-        cursor.execute(query, values)
-        db.commit()  # Don't forget to commit the changes
-        print(f"Feedback ID {feedback['ID']} has been updated.")
-        return feedback["ID"]
+        contributions = sentiment_word_contributions(stored_evaluations())
+        with db_cursor() as (conn, cursor):
+            cursor.execute("DELETE FROM SentimentWordIndex")
+            cursor.executemany(SENTIMENT_WORD_UPSERT_QUERY, [
+                (kind, key, word, count, polarity)
+                for (kind, key, word), (count, polarity) in sorted(contributions.items())
+            ])
+            conn.commit()
+        print(f"Sentiment word index has been rebuilt with {len(contributions)} words.")
     except mysql.connector.Error as error:
-        print(f"Failed to update feedback in MySQL table: {error}")
+        print(f"Failed to rebuild sentiment word index: {error}")
 
 
-def insert_evaluation(user_id, feedback_id, evaluation):
+EVALUATION_ROLLUP_QUERY = """
+    SELECT Topic, WeightedScoreSum, WeightSum FROM EvaluationRollup
+    WHERE TargetKind = %s AND TargetKey = %s
+"""
+
+
+@db_timed()
+def get_evaluation_rollup(target_kind, target_key):
+    values = (target_kind, target_key)
+
+    try:
+        with db_cursor() as (_, cursor):
+            cursor.execute(EVALUATION_ROLLUP_QUERY, values)
+            rows = cursor.fetchall()
+
+        average_scores = dict.fromkeys(EVALUATION_TOPICS)
+        for topic, weighted_score_sum, weight_sum in rows:
+            if weighted_score_sum is not None and weight_sum:
+                average_scores[topic] = float(weighted_score_sum / weight_sum)
+        return average_scores
+    except mysql.connector.Error as error:
+        print(f"Failed to fetch evaluation rollup from MySQL table: {error}")
+
+
+EVALUATION_TREND_QUERY = """
+    SELECT BucketStart, Topic, WeightedScoreSum, WeightSum FROM EvaluationTrendRollup
+    WHERE TargetKind = %s AND TargetKey = %s AND BucketSize = %s AND BucketStart >= %s
+    ORDER BY BucketStart
+"""
+
+
+@db_timed()
+def get_evaluation_trend(target_kind, target_key, bucket_size, since):
+    """Topic -> {bucket start: average score} of the buckets from since on, only those with evaluations."""
+    values = (target_kind, target_key, bucket_size, since)
+
+    try:
+        with db_cursor() as (_, cursor):
+            cursor.execute(EVALUATION_TREND_QUERY, values)
+            rows = cursor.fetchall()
+
+        trend = {topic: {} for topic in EVALUATION_TOPICS}
+        for bucket_start, topic, weighted_score_sum, weight_sum in rows:
+            if topic in trend and weighted_score_sum is not None and weight_sum:
+                trend[topic][bucket_start] = float(weighted_score_sum / weight_sum)
+        return trend
+    except mysql.connector.Error as error:
+        print(f"Failed to fetch evaluation trend from MySQL table: {error}")
+
+
+# Words are ranked by their weighted polarity, the index range scan of idx_sentiment_word_polarity
+POSITIVE_SENTIMENT_WORDS_QUERY = """
+    SELECT Word, WordCount, WeightedPolarity FROM SentimentWordIndex
+    WHERE TargetKind = %s AND TargetKey = %s AND WeightedPolarity > 0
+    ORDER BY WeightedPolarity DESC
+    LIMIT %s
+"""
+NEGATIVE_SENTIMENT_WORDS_QUERY = """
+    SELECT Word, WordCount, WeightedPolarity FROM SentimentWordIndex
+    WHERE TargetKind = %s AND TargetKey = %s AND WeightedPolarity < 0
+    ORDER BY WeightedPolarity ASC
+    LIMIT %s
+"""
+
+
+@db_timed()
+def get_sentiment_words(target_kind, target_key, limit=SENTIMENT_WORDS_LIMIT):
+    """The most positive and most negative sentiment words of a target, with their count and mean polarity."""
+    values = (target_kind, target_key, limit)
+
+    try:
+        sentiment_words = {}
+        with db_cursor() as (_, cursor):
+            for polarity, query in (("positive", POSITIVE_SENTIMENT_WORDS_QUERY),
+                                    ("negative", NEGATIVE_SENTIMENT_WORDS_QUERY)):
+                cursor.execute(query, values)
+                sentiment_words[polarity] = [
+                    {'word': word, 'count': count, 'polarity': round(float(weighted_polarity / count), 2)}
+                    for word, count, weighted_polarity in cursor.fetchall()
+                ]
+        return sentiment_words
+    except mysql.connector.Error as error:
+        print(f"Failed to fetch sentiment words from MySQL table: {error}")
+
+
+def evaluations_query(columns, filter_column, weights_as_double=False):
+    if weights_as_double:
+        # Converting DECIMAL weights to float in Python costs more than the rest of a NumPy aggregation
+        columns = [f"CAST({column} AS DOUBLE) AS {column}" if column in WEIGHT_COLUMNS else column
+                   for column in columns]
+    if filter_column is None:
+        return f"SELECT {', '.join(columns)} FROM Evaluation"
+    return f"SELECT {', '.join(columns)} FROM Evaluation WHERE {filter_column} = %s"
+
+
+def evaluation_filter(feedback_id=None, target_user_id=None, target_type=None):
+    if feedback_id is not None:
+        return "FeedbackID", feedback_id
+    if target_user_id is not None:
+        return "TargetUserID", target_user_id
+    if target_type is not None:
+        return "EvaluationTargetType", target_type
+    return None, None
+
+
+@db_timed()
+def fetch_evaluations(columns=EVALUATION_COLUMNS, feedback_id=None, target_user_id=None, target_type=None):
+    """Evaluations matching one filter as EvaluationRecords holding only the given columns.
+
+    Aggregations should ask for the columns they read, e.g. SCORE_COLUMNS, rather than whole rows.
+    """
+    columns = validate_columns(columns)
+    filter_column, value = evaluation_filter(feedback_id, target_user_id, target_type)
+    if filter_column is None:
+        return None
+
+    try:
+        with db_cursor() as (_, cursor):
+            cursor.execute(evaluations_query(columns, filter_column), (value,))
+            rows = cursor.fetchall()
+
+        from_row = EvaluationRecord.from_row
+        return [from_row(columns, row) for row in rows]
+    except mysql.connector.Error as error:
+        print(f"Failed to fetch evaluations from MySQL table: {error}")
+
+
+def iter_evaluation_chunks(columns=EVALUATION_COLUMNS, feedback_id=None, target_user_id=None, target_type=None,
+                           chunk_size=EVALUATION_FETCH_CHUNK_SIZE, weights_as_double=False, all_evaluations=False):
+    """Yields the matching Evaluation rows as lists of up to chunk_size tuples, in the order of columns.
+
+    With weights_as_double the weights come back as floats instead of Decimals. Without a filter nothing is
+    read, unless all_evaluations asks for every row, e.g. to rebuild an index.
+
+    The pooled connections are unbuffered, so only one chunk is held in memory at a time. The
+    connection stays borrowed until the generator is exhausted or closed.
+
+    Only the query and the fetches are observed in wevo_db_query_seconds, not the consumer's work between chunks.
+    """
+    columns = validate_columns(columns)
+    filter_column, value = evaluation_filter(feedback_id, target_user_id, target_type)
+    if filter_column is None and not all_evaluations:
+        return
+
+    busy_seconds = 0.0
+    started = time.perf_counter()
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(evaluations_query(columns, filter_column, weights_as_double),
+                           (value,) if filter_column is not None else ())
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    busy_seconds += time.perf_counter() - started
+                    started = None
+                    yield rows
+                    started = time.perf_counter()
+            finally:
+                if started is None:
+                    started = time.perf_counter()
+                # Closed early: the rest of the result has to be read before the connection is reused
+                if conn.unread_result:
+                    conn.consume_results()
+    except mysql.connector.Error as error:
+        print(f"Failed to stream evaluations from MySQL table: {error}")
+        raise
+    finally:
+        if started is not None:
+            busy_seconds += time.perf_counter() - started
+        DB_QUERY_SECONDS.labels("iter_evaluation_chunks").observe(busy_seconds)
+
+
+def iter_evaluations(columns=EVALUATION_COLUMNS, feedback_id=None, target_user_id=None, target_type=None,
+                     chunk_size=EVALUATION_FETCH_CHUNK_SIZE):
+    """Like fetch_evaluations, but yields the records while reading the result in chunks."""
+    columns = validate_columns(columns)
+    from_row = EvaluationRecord.from_row
+    for rows in iter_evaluation_chunks(columns, feedback_id, target_user_id, target_type, chunk_size):
+        for row in rows:
+            yield from_row(columns, row)
+
+
+def get_evaluation_from_feedback_id(feedback_id):
+    evaluations = fetch_evaluations(feedback_id=feedback_id)
+    if not evaluations:
+        print("No evaluation found for this feedback ID.")
+        return None
+    return evaluations
+
+
+def get_evaluations_from_target_user_id_or_target_type(target_user_id=None, target_type=None,
+                                                       columns=EVALUATION_COLUMNS):
+    return fetch_evaluations(columns, target_user_id=target_user_id, target_type=target_type)
+
+
+LLM_CACHE_QUERY = "SELECT Response FROM LLMResponseCache WHERE RequestHash = %s"
+
+
+@db_timed()
+def get_cached_llm_response(request_hash):
+    touch_query = "UPDATE LLMResponseCache SET LastUsedAt = %s WHERE RequestHash = %s"
+
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(LLM_CACHE_QUERY, (request_hash,))
+            row = cursor.fetchone()
+            if row:
+                cursor.execute(touch_query, (datetime.now(), request_hash))
+                conn.commit()
+        return row[0] if row else None
+    except mysql.connector.Error as error:
+        print(f"Failed to read LLM response cache: {error}")
+
+
+@db_timed()
+def put_cached_llm_response(request_hash, model, response):
     query = """
-        INSERT INTO Evaluation (
-            ID,
-            FeedbackID,
-            EvaluationTargetType,
-            TargetUserName,
-            TargetUserID,
-            UserID,
-            Timestamp,
-            Company_Fulfillment,
-            Company_FulfillmentWeight,
-            Company_Autonomy,
-            Company_AutonomyWeight,
-            Company_GrowthOpportunities,
-            Company_GrowthOpportunitiesWeight,
-            Company_Workload,
-            Company_WorkloadWeight,
-            Company_Stress,
-            Company_StressWeight,
-            Company_WorkLifeBalance,
-            Company_WorkLifeBalanceWeight,
-            Person_Recognition,
-            Person_RecognitionWeight,
-            Person_Sympathy,
-            Person_SympathyWeight,
-            Person_Trust,
-            Person_TrustWeight,
-            Person_ProSupport,
-            Person_ProSupportWeight,
-            Person_GrowthSupport,
-            Person_GrowthSupportWeight,
-            SentimentData
-        )
-        VALUES (
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s,
-            %s
+        INSERT INTO LLMResponseCache (RequestHash, Model, Response, CreatedAt, LastUsedAt)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE Response = VALUES(Response), LastUsedAt = VALUES(LastUsedAt)
+    """
+    # Keeps the LLM_CACHE_MAX_ENTRIES most recently used responses
+    evict_query = """
+        DELETE FROM LLMResponseCache
+        WHERE LastUsedAt < (
+            SELECT LastUsedAt FROM (
+                SELECT LastUsedAt FROM LLMResponseCache ORDER BY LastUsedAt DESC LIMIT 1 OFFSET %s
+            ) AS Oldest
         )
     """
 
-    values = (
-        Xid().string(),
-        feedback_id,
-        evaluation.get('EvaluationTargetType', None),
-        evaluation.get('SubjectName', ""),
-        evaluation.get('SubjectUserID', ""),
-        user_id,
-        datetime.now(),
-        evaluation.get('Company_Fulfillment', 0),
-        evaluation.get('Company_FulfillmentWeight', 0),
-        evaluation.get('Company_Autonomy', 0),
-        evaluation.get('Company_AutonomyWeight', 0),
-        evaluation.get('Company_GrowthOpportunities', 0),
-        evaluation.get('Company_GrowthOpportunitiesWeight', 0),
-        evaluation.get('Company_Workload', 0),
-        evaluation.get('Company_WorkloadWeight', 0),
-        evaluation.get('Company_Stress', 0),
-        evaluation.get('Company_StressWeight', 0),
-        evaluation.get('Company_WorkLifeBalance', 0),
-        evaluation.get('Company_WorkLifeBalanceWeight', 0),
-        evaluation.get('Person_Recognition', 0),
-        evaluation.get('Person_RecognitionWeight', 0),
-        evaluation.get('Person_Sympathy', 0),
-        evaluation.get('Person_SympathyWeight', 0),
-        evaluation.get('Person_Trust', 0),
-        evaluation.get('Person_TrustWeight', 0),
-        evaluation.get('Person_ProSupport', 0),
-        evaluation.get('Person_ProSupportWeight', 0),
-        evaluation.get('Person_GrowthSupport', 0),
-        evaluation.get('Person_GrowthSupportWeight', 0),
-        json.dumps(evaluation.get('SentimentData', []))
-    )
+    global _llm_cache_writes
+    now = datetime.now()
+    values = (request_hash, model, response, now, now)
+    with _llm_cache_writes_lock:
+        _llm_cache_writes += 1
+        evict = _llm_cache_writes % LLM_CACHE_EVICT_EVERY == 0
 
     try:
-        cursor.execute(query, values)
-        db.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, values)
+            conn.commit()
+            if evict:
+                cursor.execute(evict_query, (LLM_CACHE_MAX_ENTRIES - 1,))
+                conn.commit()
     except mysql.connector.Error as error:
-        print(f"Failed to insert evaluation into MySQL table: {error}")
+        print(f"Failed to write LLM response cache: {error}")
 
 
-def get_evaluation_from_feedback_id(feedback_id):
+@db_timed()
+def enqueue_evaluation_job(feedback_id, user_id, slack_channel, slack_thread_ts, force=False):
+    """Queue the evaluation of a feedback. The FeedbackID is the idempotency key: a job that is
+    already queued or running is left alone, a finished or failed one is queued again."""
     query = """
-        SELECT
-            ID,
-            FeedbackID,
-            EvaluationTargetType,
-            TargetUserName,
-            TargetUserID,
-            UserID,
-            Timestamp,
-            Company_Fulfillment,
-            Company_FulfillmentWeight,
-            Company_Autonomy,
-            Company_AutonomyWeight,
-            Company_GrowthOpportunities,
-            Company_GrowthOpportunitiesWeight,
-            Company_Workload,
-            Company_WorkloadWeight,
-            Company_Stress,
-            Company_StressWeight,
-            Company_WorkLifeBalance,
-            Company_WorkLifeBalanceWeight,
-            Person_Recognition,
-            Person_RecognitionWeight,
-            Person_Sympathy,
-            Person_SympathyWeight,
-            Person_Trust,
-            Person_TrustWeight,
-            Person_ProSupport,
-            Person_ProSupportWeight,
-            Person_GrowthSupport,
-            Person_GrowthSupportWeight,
-            SentimentData
-        FROM Evaluation
-        WHERE FeedbackID = %s
+        INSERT INTO EvaluationJobs (
+            ID, FeedbackID, UserID, SlackChannel, SlackThreadTs, ForceRun, Status, Attempts, AvailableAt, CreatedAt,
+            UpdatedAt
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, 'queued', 0, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            Attempts = IF(Status IN ('queued', 'running'), Attempts, 0),
+            AvailableAt = IF(Status IN ('queued', 'running'), AvailableAt, VALUES(AvailableAt)),
+            SlackChannel = VALUES(SlackChannel),
+            SlackThreadTs = VALUES(SlackThreadTs),
+            ForceRun = ForceRun OR VALUES(ForceRun),
+            UpdatedAt = VALUES(UpdatedAt),
+            Status = IF(Status IN ('queued', 'running'), Status, 'queued')
     """
 
-    values = (feedback_id,)
+    now = datetime.now()
+    values = (Xid().string(), feedback_id, user_id, slack_channel, slack_thread_ts, force, now, now, now)
 
     try:
-        cursor.execute(query, values)
-        evaluation_row = cursor.fetchall()
-
-        if evaluation_row:
-            evaluations = []
-            for row in evaluation_row:
-                evaluation = {
-                    'ID': row[0],
-                    'FeedbackID': row[1],
-                    'EvaluationTargetType': row[2],
-                    'TargetUserName': row[3],
-                    'TargetUserID': row[4],
-                    'UserID': row[5],
-                    'Timestamp': row[6],
-                    'Company_Fulfillment': row[7],
-                    'Company_FulfillmentWeight': row[8],
-                    'Company_Autonomy': row[9],
-                    'Company_AutonomyWeight': row[10],
-                    'Company_GrowthOpportunities': row[11],
-                    'Company_GrowthOpportunitiesWeight': row[12],
-                    'Company_Workload': row[13],
-                    'Company_WorkloadWeight': row[14],
-                    'Company_Stress': row[15],
-                    'Company_StressWeight': row[16],
-                    'Company_WorkLifeBalance': row[17],
-                    'Company_WorkLifeBalanceWeight': row[18],
-                    'Person_Recognition': row[19],
-                    'Person_RecognitionWeight': row[20],
-                    'Person_Sympathy': row[21],
-                    'Person_SympathyWeight': row[22],
-                    'Person_Trust': row[23],
-                    'Person_TrustWeight': row[24],
-                    'Person_ProSupport': row[25],
-                    'Person_ProSupportWeight': row[26],
-                    'Person_GrowthSupport': row[27],
-                    'Person_GrowthSupportWeight': row[28],
-                    'SentimentData': json.loads(row[29]),
-                }
-                evaluations.append(evaluation)
-            return evaluations
-        else:
-            print("No evaluation found for this feedback ID.")
-            return None
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, values)
+            conn.commit()
+        print(f"Evaluation of feedback ID {feedback_id} has been queued.")
     except mysql.connector.Error as error:
-        print(f"Failed to fetch evaluation from MySQL table: {error}")
+        print(f"Failed to insert evaluation job into MySQL table: {error}")
+
+
+EVALUATION_JOB_COLUMNS = ["ID", "FeedbackID", "UserID", "SlackChannel", "SlackThreadTs", "ForceRun", "Attempts"]
 
 
-def get_evaluations_from_target_user_id_or_target_type(target_user_id=None, target_type=None):
+CLAIM_EVALUATION_JOB_QUERY = f"""
+    SELECT {", ".join(EVALUATION_JOB_COLUMNS)} FROM EvaluationJobs
+    WHERE (Status = 'queued' AND AvailableAt <= %s) OR (Status = 'running' AND LockedUntil < %s)
+    ORDER BY AvailableAt
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+"""
+
+
+@db_timed()
+def claim_evaluation_job(visibility_timeout):
+    """Lock the next due job for this worker for visibility_timeout seconds, or return None.
+
+    Running jobs whose lock has expired are claimed again, their worker is assumed dead.
+    """
+    claim_query = """
+        UPDATE EvaluationJobs
+        SET Status = 'running', Attempts = Attempts + 1, LockedUntil = %s, UpdatedAt = %s
+        WHERE ID = %s
+    """
+
+    now = datetime.now()
+
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(CLAIM_EVALUATION_JOB_QUERY, (now, now))
+            row = cursor.fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+
+            job = dict(zip(EVALUATION_JOB_COLUMNS, row))
+            job["Attempts"] += 1
+            cursor.execute(claim_query, (now + timedelta(seconds=visibility_timeout), now, job["ID"]))
+            conn.commit()
+        return job
+    except mysql.connector.Error as error:
+        print(f"Failed to claim evaluation job from MySQL table: {error}")
+
+
+@db_timed()
+def finish_evaluation_job(job_id, status, error=None, retry_at=None):
+    """Mark a claimed job 'done' or 'failed', or put it back to 'queued' until retry_at."""
     query = """
-        SELECT
-            ID,
-            FeedbackID,
-            EvaluationTargetType,
-            TargetUserName,
-            TargetUserID,
-            UserID,
-            Timestamp,
-            Company_Fulfillment,
-            Company_FulfillmentWeight,
-            Company_Autonomy,
-            Company_AutonomyWeight,
-            Company_GrowthOpportunities,
-            Company_GrowthOpportunitiesWeight,
-            Company_Workload,
-            Company_WorkloadWeight,
-            Company_Stress,
-            Company_StressWeight,
-            Company_WorkLifeBalance,
-            Company_WorkLifeBalanceWeight,
-            Person_Recognition,
-            Person_RecognitionWeight,
-            Person_Sympathy,
-            Person_SympathyWeight,
-            Person_Trust,
-            Person_TrustWeight,
-            Person_ProSupport,
-            Person_ProSupportWeight,
-            Person_GrowthSupport,
-            Person_GrowthSupportWeight,
-            SentimentData
-        FROM Evaluation
+        UPDATE EvaluationJobs
+        SET Status = %s, LastError = %s, AvailableAt = COALESCE(%s, AvailableAt), LockedUntil = NULL, UpdatedAt = %s
+        WHERE ID = %s
     """
 
-    if target_user_id is not None:
-        query += " WHERE TargetUserID = %s"
-        values = (target_user_id,)
-    elif target_type is not None:
-        query += " WHERE EvaluationTargetType = %s"
-        values = (target_type,)
-    else:
-        return None
+    values = (status, error, retry_at, datetime.now(), job_id)
 
     try:
-        cursor.execute(query, values)
-        rows = cursor.fetchall()
-        evaluations = []
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, values)
+            conn.commit()
+    except mysql.connector.Error as error:
+        print(f"Failed to update evaluation job in MySQL table: {error}")
 
-        for row in rows:
-            evaluation = {
-                'ID': row[0],
-                'FeedbackID': row[1],
-                'EvaluationTargetType': row[2],
-                'TargetUserName': row[3],
-                'TargetUserID': row[4],
-                'UserID': row[5],
-                'Timestamp': row[6],
-                'Company_Fulfillment': row[7],
-                'Company_FulfillmentWeight': row[8],
-                'Company_Autonomy': row[9],
-                'Company_AutonomyWeight': row[10],
-                'Company_GrowthOpportunities': row[11],
-                'Company_GrowthOpportunitiesWeight': row[12],
-                'Company_Workload': row[13],
-                'Company_WorkloadWeight': row[14],
-                'Company_Stress': row[15],
-                'Company_StressWeight': row[16],
-                'Company_WorkLifeBalance': row[17],
-                'Company_WorkLifeBalanceWeight': row[18],
-                'Person_Recognition': row[19],
-                'Person_RecognitionWeight': row[20],
-                'Person_Sympathy': row[21],
-                'Person_SympathyWeight': row[22],
-                'Person_Trust': row[23],
-                'Person_TrustWeight': row[24],
-                'Person_ProSupport': row[25],
-                'Person_ProSupportWeight': row[26],
-                'Person_GrowthSupport': row[27],
-                'Person_GrowthSupportWeight': row[28],
-                'SentimentData': json.loads(row[29]),
-            }
-            evaluations.append(evaluation)
 
-        return evaluations
+@db_timed()
+def prune_evaluation_jobs(finished_before, limit=1000):
+    """Delete up to limit jobs that were done or failed before finished_before, returning how many were deleted."""
+    query = """
+        DELETE FROM EvaluationJobs
+        WHERE Status IN ('done', 'failed') AND UpdatedAt < %s
+        LIMIT %s
+    """
+
+    try:
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, (finished_before, limit))
+            deleted = cursor.rowcount
+            conn.commit()
+        return deleted
     except mysql.connector.Error as error:
-        print(f"Failed to fetch evaluations from MySQL table: {error}")
+        print(f"Failed to prune evaluation jobs from MySQL table: {error}")
+        return 0
 
 
+@db_timed()
 def register_relation(user_id1, user_id2, relationship):
     new_id = str(Xid())
 
@@ -531,8 +1135,11 @@ def register_relation(user_id1, user_id2, relationship):
     values = (new_id, user_id1, user_id2, relationship)
 
     try:
-        cursor.execute(query, values)
-        db.commit()
+        with db_cursor() as (conn, cursor):
+            cursor.execute(query, values)
+            conn.commit()
+        _relations_cache.pop(user_id1)
+        _relations_cache.pop(user_id2)
         print(f"New relation '{relationship}' between users '{user_id1}' and '{user_id2}' has been added with ID: {new_id}")
     except mysql.connector.Error as error:
         print(f"Failed to insert into MySQL table. Error: {error}")
@@ -0,0 +1,13 @@
+USE wevo;
+
+-- Running weighted sums per evaluation target, maintained by insert_evaluation.
+-- Existing rows can be folded in with: python3 manage.py rebuild-rollup
+CREATE TABLE IF NOT EXISTS EvaluationRollup
+(
+    TargetKind       VARCHAR(16),  -- 'company', 'user' (TargetUserID) or 'name' (TargetUserName of Type 3)
+    TargetKey        VARCHAR(255),
+    Topic            VARCHAR(64),  -- e.g. 'Person_Trust'
+    WeightedScoreSum DECIMAL(20, 4),
+    WeightSum        DECIMAL(20, 4),
+    PRIMARY KEY (TargetKind, TargetKey, Topic)
+);
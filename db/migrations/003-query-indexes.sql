@@ -0,0 +1,10 @@
+USE wevo;
+
+-- get_feedback and get_uncalculated_feedback_ids: equality on UserID and IsCalculated, range and order on Timestamp
+CREATE INDEX idx_feedback_user_calculated_timestamp ON Feedback (UserID, IsCalculated, Timestamp);
+
+-- get_evaluations_from_target_user_id_or_target_type and the evaluation scans of service.py
+CREATE INDEX idx_evaluation_target_user ON Evaluation (TargetUserID);
+CREATE INDEX idx_evaluation_target_type ON Evaluation (EvaluationTargetType);
+
+-- get_evaluation_from_feedback_id is already served by the index InnoDB creates for the FeedbackID foreign key
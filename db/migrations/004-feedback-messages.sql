@@ -0,0 +1,23 @@
+USE wevo;
+
+-- One row per chat message, so a turn appends rows instead of rewriting Feedback.Data
+CREATE TABLE IF NOT EXISTS FeedbackMessages
+(
+    FeedbackID VARCHAR(32),
+    Seq        INT,          -- Position of the message in the conversation, starting at 0
+    Role       VARCHAR(16),  -- 'system', 'user' or 'assistant'
+    Content    TEXT,
+    PRIMARY KEY (FeedbackID, Seq),
+    FOREIGN KEY (FeedbackID) REFERENCES Feedback (ID)
+);
+
+-- Split the Data blobs of existing sessions into rows. Feedback.Data is no longer written after this.
+INSERT IGNORE INTO FeedbackMessages (FeedbackID, Seq, Role, Content)
+SELECT Feedback.ID, Messages.Seq - 1, Messages.Role, Messages.Content
+FROM Feedback,
+     JSON_TABLE(Feedback.Data, '$[*]' COLUMNS (
+         Seq FOR ORDINALITY,
+         Role VARCHAR(16) PATH '$.role',
+         Content TEXT PATH '$.content'
+     )) AS Messages
+WHERE Feedback.Data IS NOT NULL;
@@ -0,0 +1,7 @@
+USE wevo;
+
+-- Number of stored FeedbackMessages, checked and bumped by every append so concurrent turns cannot both write
+ALTER TABLE Feedback ADD COLUMN Version INT NOT NULL DEFAULT 0;
+
+UPDATE Feedback
+SET Version = (SELECT COUNT(*) FROM FeedbackMessages WHERE FeedbackMessages.FeedbackID = Feedback.ID);
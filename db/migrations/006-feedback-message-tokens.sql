@@ -0,0 +1,5 @@
+USE wevo;
+
+-- Estimated token count of each message, computed once when it is written.
+-- Rows from before this migration stay NULL and are estimated when read.
+ALTER TABLE FeedbackMessages ADD COLUMN TokenCount INT;
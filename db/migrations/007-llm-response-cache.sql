@@ -0,0 +1,12 @@
+USE wevo;
+
+-- Function-call arguments returned for evaluate_with_gpt3 requests, keyed by a hash of model, messages and functions
+CREATE TABLE IF NOT EXISTS LLMResponseCache
+(
+    RequestHash CHAR(64) PRIMARY KEY,
+    Model       VARCHAR(64),
+    Response    MEDIUMTEXT,
+    CreatedAt   DATETIME,
+    LastUsedAt  DATETIME,
+    INDEX idx_llm_response_cache_last_used (LastUsedAt)
+);
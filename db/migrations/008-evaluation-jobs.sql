@@ -0,0 +1,23 @@
+USE wevo;
+
+-- Queue of feedback evaluations, worked off by the evaluation workers in jobs.py
+CREATE TABLE IF NOT EXISTS EvaluationJobs
+(
+    ID            VARCHAR(32) PRIMARY KEY,
+    FeedbackID    VARCHAR(32) UNIQUE, -- Idempotency key: at most one job per feedback
+    UserID        VARCHAR(32),
+    SlackChannel  VARCHAR(32),        -- Where the user is notified once the job is done
+    SlackThreadTs VARCHAR(32),
+    ForceRun      BOOLEAN DEFAULT FALSE, -- Ask the model again instead of reusing a cached evaluation
+    Status        VARCHAR(16),        -- 'queued', 'running', 'done' or 'failed'
+    Attempts      INT DEFAULT 0,
+    AvailableAt   DATETIME,           -- Not claimed before this time, pushed back on retries
+    LockedUntil   DATETIME,           -- Visibility timeout of a running job
+    LastError     TEXT,
+    CreatedAt     DATETIME,
+    UpdatedAt     DATETIME,
+    INDEX idx_evaluation_jobs_queued (Status, AvailableAt),
+    INDEX idx_evaluation_jobs_running (Status, LockedUntil),
+    FOREIGN KEY (FeedbackID) REFERENCES Feedback (ID),
+    FOREIGN KEY (UserID) REFERENCES Users (ID)
+);
@@ -0,0 +1,14 @@
+USE wevo;
+
+-- SentimentData words summed per evaluation target, maintained by insert_evaluation next to EvaluationRollup.
+-- Existing rows can be folded in with: python3 manage.py rebuild-sentiment-words
+CREATE TABLE IF NOT EXISTS SentimentWordIndex
+(
+    TargetKind       VARCHAR(16),  -- Same targets as EvaluationRollup
+    TargetKey        VARCHAR(255),
+    Word             VARCHAR(64),  -- Lower case
+    WordCount        INT,
+    WeightedPolarity DECIMAL(20, 4), -- Sum of weight * count, positive words above 0
+    PRIMARY KEY (TargetKind, TargetKey, Word),
+    INDEX idx_sentiment_word_polarity (TargetKind, TargetKey, WeightedPolarity)
+);
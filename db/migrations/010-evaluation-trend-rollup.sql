@@ -0,0 +1,16 @@
+USE wevo;
+
+-- Weighted sums like EvaluationRollup, per day and per week (starting Monday) of the evaluation Timestamp.
+-- Maintained by insert_evaluation, existing rows are folded in by: python3 manage.py rebuild-rollup
+CREATE TABLE IF NOT EXISTS EvaluationTrendRollup
+(
+    TargetKind       VARCHAR(16),
+    TargetKey        VARCHAR(255),
+    BucketSize       VARCHAR(8),   -- 'day' or 'week'
+    BucketStart      DATE,
+    Topic            VARCHAR(64),
+    WeightedScoreSum DECIMAL(20, 4),
+    WeightSum        DECIMAL(20, 4),
+    -- A time series of one target is a range scan over BucketStart
+    PRIMARY KEY (TargetKind, TargetKey, BucketSize, BucketStart, Topic)
+);
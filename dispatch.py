@@ -0,0 +1,155 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import ERRORS, SLACK_HANDLER_SECONDS
+from tracing import span
+
+DISPATCH_WORKERS = int(os.getenv('DISPATCH_WORKERS', '16'))
+
+
+class _WaitStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, wait):
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+
+    def as_dict(self):
+        return {
+            "dispatched": self.count,
+            "wait_avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "wait_max_ms": round(self.max * 1000, 2),
+        }
+
+
+class UserDispatcher:
+    """Runs Slack events one at a time per user, and different users in parallel.
+
+    Each user gets a lane: a queue of pending events that is drained, in order, by at most
+    one pool thread at a time. A slow event only holds up later events of the same user.
+    """
+
+    def __init__(self, workers=DISPATCH_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wevo-dispatch")
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._waits = _WaitStats()
+
+    def submit(self, user_id, func, *args, **kwargs):
+        with self._lock:
+            lane = self._lanes.get(user_id)
+            is_idle = lane is None
+            if is_idle:
+                lane = self._lanes[user_id] = deque()
+            lane.append((time.monotonic(), func, args, kwargs))
+        if is_idle:
+            self._executor.submit(self._drain, user_id)
+
+    def ordered(self, handler):
+        """Decorator for Bolt message handlers: the handler returns at once and its body runs on the user's lane."""
+        @functools.wraps(handler)
+        def wrapper(message, **kwargs):
+            self.submit(message.get('user'), handler, message, **kwargs)
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            depths = [len(lane) for lane in self._lanes.values()]
+            stats = self._waits.as_dict()
+        stats.update({"active_lanes": len(depths), "queued": sum(depths), "max_lane_depth": max(depths, default=0)})
+        return stats
+
+    def shutdown(self):
+        """Wait for every queued event to be handled."""
+        self._executor.shutdown(wait=True)
+
+    def _drain(self, user_id):
+        while True:
+            with self._lock:
+                lane = self._lanes[user_id]
+                if not lane:
+                    # Removed under the lock so the next submit for this user starts a new drain
+                    del self._lanes[user_id]
+                    return
+                enqueued_at, func, args, kwargs = lane.popleft()
+                self._waits.record(time.monotonic() - enqueued_at)
+
+            started = time.perf_counter()
+            try:
+                # Every Slack event starts its own trace
+                with span(f"slack.{func.__name__}", new_trace=True, slack_user_id=user_id):
+                    func(*args, **kwargs)
+            except Exception as error:
+                ERRORS.labels("slack_handler").inc()
+                print(f"Failed to handle event of user {user_id}: {error}")
+            finally:
+                SLACK_HANDLER_SECONDS.labels(func.__name__).observe(time.perf_counter() - started)
+
+
+class AsyncUserDispatcher:
+    """Event loop counterpart of UserDispatcher, with one task per busy lane instead of pool threads."""
+
+    def __init__(self):
+        self._lanes = {}
+        self._tasks = set()
+        self._waits = _WaitStats()
+
+    def submit(self, user_id, coroutine_func, *args, **kwargs):
+        lane = self._lanes.get(user_id)
+        is_idle = lane is None
+        if is_idle:
+            lane = self._lanes[user_id] = deque()
+        lane.append((time.monotonic(), coroutine_func, args, kwargs))
+        if is_idle:
+            task = asyncio.create_task(self._drain(user_id))
+            # The loop only keeps weak references to tasks
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def ordered(self, handler):
+        @functools.wraps(handler)
+        async def wrapper(message, **kwargs):
+            self.submit(message.get('user'), handler, message, **kwargs)
+        return wrapper
+
+    def stats(self):
+        depths = [len(lane) for lane in self._lanes.values()]
+        stats = self._waits.as_dict()
+        stats.update({"active_lanes": len(depths), "queued": sum(depths), "max_lane_depth": max(depths, default=0)})
+        return stats
+
+    async def shutdown(self):
+        await asyncio.gather(*self._tasks)
+
+    async def _drain(self, user_id):
+        lane = self._lanes[user_id]
+        while lane:
+            enqueued_at, coroutine_func, args, kwargs = lane.popleft()
+            self._waits.record(time.monotonic() - enqueued_at)
+            started = time.perf_counter()
+            try:
+                with span(f"slack.{coroutine_func.__name__}", new_trace=True, slack_user_id=user_id):
+                    await coroutine_func(*args, **kwargs)
+            except Exception as error:
+                ERRORS.labels("slack_handler").inc()
+                print(f"Failed to handle event of user {user_id}: {error}")
+            finally:
+                SLACK_HANDLER_SECONDS.labels(coroutine_func.__name__).observe(time.perf_counter() - started)
+        del self._lanes[user_id]
+
+
+user_dispatcher = UserDispatcher()
+async_user_dispatcher = AsyncUserDispatcher()
+
+
+def dispatch_stats():
+    return {"threads": user_dispatcher.stats(), "async": async_user_dispatcher.stats()}
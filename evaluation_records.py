@@ -0,0 +1,71 @@
+import json
+
+from evaluation_specs import EVALUATION_TOPICS
+
+# The one definition of the Evaluation table's columns, in table order
+SCORE_COLUMNS = [column for topic in EVALUATION_TOPICS for column in (topic, f"{topic}Weight")]
+WEIGHT_COLUMNS = SCORE_COLUMNS[1::2]
+EVALUATION_COLUMNS = [
+    "ID",
+    "FeedbackID",
+    "EvaluationTargetType",
+    "TargetUserName",
+    "TargetUserID",
+    "UserID",
+    "Timestamp",
+    *SCORE_COLUMNS,
+    "SentimentData",
+]
+
+
+class EvaluationRecord:
+    """One Evaluation row holding only the fetched columns, read as attributes or like a dict.
+
+    SentimentData is kept as the stored JSON text and decoded on first access. Reading a column
+    that was not fetched raises AttributeError, or returns the default with get().
+    """
+
+    __slots__ = ("_columns", "_sentiment_json", "_sentiment_data",
+                 *(column for column in EVALUATION_COLUMNS if column != "SentimentData"))
+
+    @classmethod
+    def from_row(cls, columns, row):
+        record = cls.__new__(cls)
+        record._columns = columns
+        for column, value in zip(columns, row):
+            setattr(record, "_sentiment_json" if column == "SentimentData" else column, value)
+        return record
+
+    @property
+    def SentimentData(self):
+        try:
+            return self._sentiment_data
+        except AttributeError:
+            sentiment_json = self._sentiment_json
+        self._sentiment_data = json.loads(sentiment_json) if sentiment_json else []
+        return self._sentiment_data
+
+    def get(self, column, default=None):
+        return getattr(self, column, default)
+
+    def __getitem__(self, column):
+        try:
+            return getattr(self, column)
+        except AttributeError:
+            raise KeyError(column) from None
+
+    def keys(self):
+        return list(self._columns)
+
+    def as_dict(self):
+        return {column: getattr(self, column) for column in self._columns}
+
+    def __repr__(self):
+        return f"EvaluationRecord({self.as_dict()!r})"
+
+
+def validate_columns(columns):
+    unknown = [column for column in columns if column not in EVALUATION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown Evaluation columns: {unknown}")
+    return tuple(columns)
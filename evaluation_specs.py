@@ -1,3 +1,17 @@
+EVALUATION_TOPICS = [
+    "Company_Fulfillment",
+    "Company_Autonomy",
+    "Company_GrowthOpportunities",
+    "Company_Workload",
+    "Company_Stress",
+    "Company_WorkLifeBalance",
+    "Person_Recognition",
+    "Person_Sympathy",
+    "Person_Trust",
+    "Person_ProSupport",
+    "Person_GrowthSupport",
+]
+
 EVALUATIONS_DESCRIPTION = {
     "Company": {
         "Fulfillment": {
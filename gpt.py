@@ -1,23 +1,99 @@
+import hashlib
+import json
 import os
 import openai
 
+from metrics import llm_timed, record_llm_tokens
+from tokens import estimate_tokens, message_tokens
+from tracing import add_span_attributes, traced
+
 openai.organization = os.getenv('OPENAI_ORG_TOKEN')
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
+GPT_MODEL = "gpt-3.5-turbo-16k"
+
+
+def record_usage(function, response):
+    record_llm_tokens(function, response.usage.prompt_tokens, response.usage.completion_tokens)
+    add_span_attributes(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens)
+
+
+def record_estimated_usage(function, messages, reply):
+    # Streamed responses carry no usage, so both sides are estimated locally
+    record_llm_tokens(function, sum(message_tokens(message) for message in messages), estimate_tokens(reply))
+
 
+def request_hash(messages, functions=None):
+    """Content address of a completion request, used as the key of the response cache."""
+    request = {"model": GPT_MODEL, "messages": messages, "functions": functions}
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+
+@llm_timed()
+@traced()
 def chat_with_gpt3(messages):
     response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo-16k",
+        model=GPT_MODEL,
         messages=messages,
     )
+    record_usage("chat_with_gpt3", response)
     return response.choices[0].message
 
 
+@llm_timed()
+@traced()
+def stream_chat_with_gpt3(messages):
+    """Yield the reply text piece by piece as the model generates it."""
+    response = openai.ChatCompletion.create(
+        model=GPT_MODEL,
+        messages=messages,
+        stream=True,
+    )
+    reply = ""
+    for chunk in response:
+        content = chunk.choices[0].delta.get("content")
+        if content:
+            reply += content
+            yield content
+    record_estimated_usage("stream_chat_with_gpt3", messages, reply)
+
+
+@llm_timed()
+@traced()
 def evaluate_with_gpt3(messages, functions):
     response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo-16k",
+        model=GPT_MODEL,
         messages=messages,
         functions=functions,
         function_call={"name": "insert_evaluation"},
     )
+    record_usage("evaluate_with_gpt3", response)
     return response.choices[0].message
+
+
+@llm_timed()
+@traced()
+async def chat_with_gpt3_async(messages):
+    response = await openai.ChatCompletion.acreate(
+        model=GPT_MODEL,
+        messages=messages,
+    )
+    record_usage("chat_with_gpt3_async", response)
+    return response.choices[0].message
+
+
+@llm_timed()
+@traced()
+async def stream_chat_with_gpt3_async(messages):
+    response = await openai.ChatCompletion.acreate(
+        model=GPT_MODEL,
+        messages=messages,
+        stream=True,
+    )
+    reply = ""
+    async for chunk in response:
+        content = chunk.choices[0].delta.get("content")
+        if content:
+            reply += content
+            yield content
+    record_estimated_usage("stream_chat_with_gpt3_async", messages, reply)
@@ -0,0 +1,194 @@
+import json
+
+from xid import Xid
+
+from commands import CMD_CREATE_USER, CMD_ASSUME_USER, CMD_MANUAL_START, CMD_MANUAL_CALCULATE, CMD_GET_EVALUATION, \
+    CMD_SET_RELATION
+from database import get_user_info_from_slack, insert_user, assume_user, get_user_info, get_evaluation_from_feedback_id, \
+    register_relation, TREND_BUCKETS, TREND_WEEK
+from evaluation_specs import EVALUATION_TOPICS
+from score_stats import TIME_BUCKETS
+from service import enqueue_evaluations, evaluation_for_user_id, evaluation_for_company, evaluation_statistics, \
+    sentiment_words_for_user_id, sentiment_words_for_company, evaluation_trend_for_user_id, evaluation_trend_for_company
+
+# Command parsing and replies of the Slack handlers, shared by slack.py and slack_async.py.
+# The *_reply functions only block on MySQL, so slack_async.py runs them with run_db.
+
+_REGISTER_STEPS = f"""```
+make sure to create a user:
+{CMD_CREATE_USER} $user_name
+
+and assume your account as the created user:
+{CMD_ASSUME_USER} $user_id
+```"""
+
+NOT_REGISTERED_MESSAGE = "Failed to initiate:\n" + _REGISTER_STEPS
+CHAT_NOT_REGISTERED_MESSAGE = "Failed to initiate chat:\n" + _REGISTER_STEPS
+SESSION_CLOSED_MESSAGE = (f"Your feedback session has been closed or has expired. "
+                          f"Run `{CMD_MANUAL_START}` to re-initiate a new session.")
+
+
+def command_argument(message, command):
+    return message["text"][len(command) + 1:]
+
+
+def json_reply(result):
+    return f"""```{json.dumps(result, indent=1, default=str)}```"""
+
+
+def feedback_id_reply(feedback_id):
+    return f"\n```debug: feedback_id: {feedback_id}.```"
+
+
+def who_am_i_reply(message):
+    user_id, user_name, relations = get_user_info_from_slack(message['user'], get_relations=True)
+    if not user_id:
+        return "You are nothin but a bunch of atoms."
+
+    return f"""You are:
+```
+ID    : {user_id}
+NAME  : {user_name}
+RELATIONS :
+{json.dumps(relations, indent=1)}```"""
+
+
+def create_user_reply(message):
+    content = command_argument(message, CMD_CREATE_USER)
+    gen_id = Xid().string()
+    insert_user(gen_id, content, 0)
+    return f"""A new user has been added!
+```
+ID      : {gen_id}
+NAME    : {content}```"""
+
+
+def assume_user_reply(message):
+    content = command_argument(message, CMD_ASSUME_USER)
+
+    user_id, _, _ = get_user_info(content)
+    if not user_id:
+        return """Failed to assume user:
+```user not found.```"""
+
+    assume_user(message['user'], user_id)
+
+    return f"""Successfully assumed user as:
+```ID   : {user_id}```"""
+
+
+def set_relation_reply(message):
+    content = command_argument(message, CMD_SET_RELATION)
+
+    user_id, _, _ = get_user_info_from_slack(message['user'])
+    if not user_id:
+        return """Failed to initiate:
+```user not found.```"""
+
+    args = content.split(" ")
+    if len(args) < 2:
+        return "Invalid arguments."
+    if user_id == args[0]:
+        return "You can not add yourself as a relation."
+
+    user_id_2, _, _ = get_user_info(args[0])
+    if not user_id_2:
+        return "Target user not found."
+
+    register_relation(user_id, user_id_2, args[1])
+
+    return "Successfully added relation."
+
+
+def manual_calculate_reply(message):
+    user_id, _, _ = get_user_info_from_slack(message['user'])
+    if not user_id:
+        return NOT_REGISTERED_MESSAGE
+
+    # `!manual-evaluate force` asks the model again instead of reusing cached evaluations
+    force = command_argument(message, CMD_MANUAL_CALCULATE).strip() == "force"
+    # Evaluations take a while, so they are queued and the workers reply in the thread when done
+    return enqueue_evaluations(user_id, message['channel'], message['ts'], force)
+
+
+def evaluation_reply(message):
+    args = command_argument(message, CMD_GET_EVALUATION).split(" ")
+
+    if not args[0]:
+        user_id, _, _ = get_user_info_from_slack(message['user'])
+        if not user_id:
+            return CHAT_NOT_REGISTERED_MESSAGE
+        return json_reply(evaluation_for_user_id(user_id))
+
+    if args[0] == "company":
+        return json_reply(evaluation_for_company())
+
+    if args[0] == "feedback" and len(args) > 1:
+        evaluations = get_evaluation_from_feedback_id(args[1])
+        if not evaluations:
+            return "Either feedback or evaluation not found. Run `!manual-evaluate` to evaluate feedbacks."
+        return json_reply([evaluation.as_dict() for evaluation in evaluations])
+
+    if args[0] == "user" and len(args) > 1:
+        user_id, _, _ = get_user_info(args[1])
+        if not user_id:
+            return CHAT_NOT_REGISTERED_MESSAGE
+        return json_reply(evaluation_for_user_id(user_id))
+
+    if args[0] == "stats" and len(args) > 1 and args[1] in ("company", "users", "user"):
+        return statistics_reply(args)
+
+    if args[0] == "words" and len(args) > 1 and args[1] in ("company", "user"):
+        return words_reply(args)
+
+    if args[0] == "trend" and len(args) > 1 and args[1] in ("company", "user"):
+        return trend_reply(args)
+
+    return "Invalid command."
+
+
+def target_user_id(args):
+    """User ID of `<subcommand> user user_id ...`, or None if there is no such user."""
+    user_id, _, _ = get_user_info(args[2]) if len(args) > 2 else (None, None, None)
+    return user_id
+
+
+def statistics_reply(args):
+    # `stats company [day|week]`, `stats user user_id [day|week]` or `stats users`, one summary per user
+    group_by = args[-1] if args[-1] in TIME_BUCKETS else None
+    if args[1] == "company":
+        return json_reply(evaluation_statistics(target_type=1, group_by=group_by))
+    if args[1] == "users":
+        return json_reply(evaluation_statistics(target_type=2, group_by='user'))
+
+    user_id = target_user_id(args)
+    if not user_id:
+        return "User not found."
+    return json_reply(evaluation_statistics(target_user_id=user_id, group_by=group_by))
+
+
+def words_reply(args):
+    if args[1] == "company":
+        return json_reply(sentiment_words_for_company())
+
+    user_id = target_user_id(args)
+    if not user_id:
+        return "User not found."
+    return json_reply(sentiment_words_for_user_id(user_id))
+
+
+def trend_reply(args):
+    # `trend company [day|week] [topic]` or `trend user user_id [day|week] [topic]`, weekly by default
+    options = args[2:] if args[1] == "company" else args[3:]
+    unknown = [arg for arg in options if arg and arg not in TREND_BUCKETS and arg not in EVALUATION_TOPICS]
+    if unknown:
+        return f"Unknown topic: {unknown[0]}"
+    bucket_size = next((arg for arg in options if arg in TREND_BUCKETS), TREND_WEEK)
+    topic = next((arg for arg in options if arg in EVALUATION_TOPICS), None)
+    if args[1] == "company":
+        return json_reply(evaluation_trend_for_company(bucket_size, topic))
+
+    user_id = target_user_id(args)
+    if not user_id:
+        return "User not found."
+    return json_reply(evaluation_trend_for_user_id(user_id, bucket_size, topic))
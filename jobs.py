@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database import claim_evaluation_job, finish_evaluation_job, get_feedback_by_id, prune_evaluation_jobs
+from metrics import ERRORS
+from tracing import span
+from service import calculate_feedback
+
+EVALUATION_WORKERS = int(os.getenv('EVALUATION_WORKERS', '2'))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv('JOB_POLL_INTERVAL_SECONDS', '1'))
+# A running job whose worker has not finished it within this time is handed to another worker
+JOB_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv('JOB_VISIBILITY_TIMEOUT_SECONDS', '300'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+JOB_BACKOFF_BASE_SECONDS = int(os.getenv('JOB_BACKOFF_BASE_SECONDS', '10'))
+# Done and failed jobs are deleted this long after they finished, checked at most once per interval while idle
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', '7'))
+JOB_PRUNE_INTERVAL_SECONDS = float(os.getenv('JOB_PRUNE_INTERVAL_SECONDS', '3600'))
+# Rows deleted per statement, so pruning never holds locks on the whole table
+JOB_PRUNE_BATCH_SIZE = 1000
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=JOB_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+class EvaluationWorkers:
+    """Threads working off the EvaluationJobs table.
+
+    notify(channel, thread_ts, text) is called once a job is done or has failed for good.
+    """
+
+    def __init__(self, notify, workers=EVALUATION_WORKERS):
+        self.notify = notify
+        self.workers = workers
+        self._stopped = threading.Event()
+        self._threads = []
+        self._next_prune = 0.0
+        self._prune_lock = threading.Lock()
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"wevo-eval-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Let the running jobs finish and stop claiming new ones."""
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                job = claim_evaluation_job(JOB_VISIBILITY_TIMEOUT_SECONDS)
+            except Exception as error:
+                print(f"Failed to claim evaluation job: {error}")
+                job = None
+
+            if job is None:
+                self._prune_finished_jobs()
+                self._stopped.wait(JOB_POLL_INTERVAL_SECONDS)
+                continue
+
+            with span("jobs.evaluate_feedback", new_trace=True, job_id=job["ID"], feedback_id=job["FeedbackID"],
+                      attempt=job["Attempts"]):
+                self._process(job)
+
+    def _process(self, job):
+        feedback_id = job["FeedbackID"]
+        try:
+            feedback = get_feedback_by_id(feedback_id)
+            if feedback is None:
+                raise LookupError(f"Feedback ID {feedback_id} not found.")
+
+            # A retried or duplicate job must not store the evaluations twice
+            if not feedback["IsCalculated"]:
+                calculate_feedback(feedback, job["ForceRun"])
+        except Exception as error:
+            ERRORS.labels("evaluation_job").inc()
+            print(f"Failed to evaluate feedback ID {feedback_id} (attempt {job['Attempts']}): {error}")
+            if job["Attempts"] < JOB_MAX_ATTEMPTS:
+                finish_evaluation_job(job["ID"], "queued", str(error), datetime.now() + retry_delay(job["Attempts"]))
+                return
+
+            finish_evaluation_job(job["ID"], "failed", str(error))
+            self._notify(job, f"Feedback {feedback_id} could not be evaluated after {job['Attempts']} attempts."
+                              f"\n```debug: {error}```")
+            return
+
+        finish_evaluation_job(job["ID"], "done")
+        self._notify(job, f"Feedback {feedback_id} has been evaluated. "
+                          f"Use `!get-evaluation feedback {feedback_id}` to see the result.")
+
+    def _prune_finished_jobs(self):
+        with self._prune_lock:
+            if time.monotonic() < self._next_prune:
+                return
+            self._next_prune = time.monotonic() + JOB_PRUNE_INTERVAL_SECONDS
+
+        finished_before = datetime.now() - timedelta(days=JOB_RETENTION_DAYS)
+        total = 0
+        while not self._stopped.is_set():
+            deleted = prune_evaluation_jobs(finished_before, JOB_PRUNE_BATCH_SIZE)
+            total += deleted
+            if deleted < JOB_PRUNE_BATCH_SIZE:
+                break
+        if total:
+            print(f"{total} finished evaluation jobs have been deleted.")
+
+    def _notify(self, job, text):
+        try:
+            self.notify(job["SlackChannel"], job["SlackThreadTs"], text)
+        except Exception as error:
+            print(f"Failed to notify user ID {job['UserID']}: {error}")
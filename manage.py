@@ -0,0 +1,57 @@
+import argparse
+import sys
+
+from database import rebuild_evaluation_rollup, rebuild_sentiment_word_index
+from migrations import apply_migrations, check_query_plans
+from service import evaluation_for_company, scan_average_scores
+
+# Rollup and scan round differently in the last digits
+ROLLUP_TOLERANCE = 1e-6
+
+
+def rollup_mismatches(rollup, scanned):
+    mismatches = {}
+    for topic, scanned_score in scanned.items():
+        rollup_score = rollup[topic]
+        if rollup_score is None or scanned_score is None:
+            if rollup_score is not scanned_score:
+                mismatches[topic] = (rollup_score, scanned_score)
+        elif abs(rollup_score - float(scanned_score)) > ROLLUP_TOLERANCE:
+            mismatches[topic] = (rollup_score, scanned_score)
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wevo maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("migrate", help="Apply pending db/migrations/NNN-*.sql migrations in order")
+    subparsers.add_parser("check-query-plans", help="Fail if any query in database.py does a full table scan")
+    subparsers.add_parser("rebuild-rollup", help="Recompute the evaluation rollup and trend tables from all Evaluation rows")
+    subparsers.add_parser("rebuild-sentiment-words",
+                          help="Recompute the sentiment word index from the SentimentData of all Evaluation rows")
+    subparsers.add_parser("verify-rollup",
+                          help="Fail if the company rollup differs from a streamed scan of all company evaluations")
+
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        apply_migrations()
+    elif args.command == "check-query-plans":
+        if check_query_plans():
+            sys.exit(1)
+        print("No full table scans found.")
+    elif args.command == "rebuild-rollup":
+        rebuild_evaluation_rollup()
+    elif args.command == "rebuild-sentiment-words":
+        rebuild_sentiment_word_index()
+    elif args.command == "verify-rollup":
+        mismatches = rollup_mismatches(evaluation_for_company(), scan_average_scores(target_type=1))
+        if mismatches:
+            print(f"Company rollup differs from the Evaluation rows (rollup, scan): {mismatches}")
+            sys.exit(1)
+        print("Company rollup matches the Evaluation rows.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import functools
+import inspect
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+LLM_REQUEST_SECONDS = Histogram(
+    "wevo_llm_request_seconds", "Duration of OpenAI calls, until the last chunk for streamed replies", ["function"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120))
+LLM_TOKENS = Counter("wevo_llm_tokens_total", "Tokens sent to and received from OpenAI", ["function", "kind"])
+DB_QUERY_SECONDS = Histogram(
+    "wevo_db_query_seconds", "Duration of database.py functions, including the wait for a pooled connection",
+    ["function"], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+SLACK_HANDLER_SECONDS = Histogram(
+    "wevo_slack_handler_seconds", "Duration of Slack message handlers, by handler", ["handler"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60))
+ERRORS = Counter("wevo_errors_total", "Errors by component", ["component"])
+ACTIVE_SESSIONS = Gauge("wevo_active_sessions", "Feedback sessions cached in memory")
+
+
+def record_llm_tokens(function, prompt_tokens, completion_tokens):
+    LLM_TOKENS.labels(function, "prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(function, "completion").inc(completion_tokens)
+
+
+def timed(histogram, component, label=None):
+    """Decorator observing the duration of a function, coroutine or (async) generator in histogram.
+
+    The label defaults to the function name. Exceptions are counted in ERRORS under component, if given.
+    """
+    def decorator(func):
+        name = label or func.__name__
+        observe = histogram.labels(name).observe
+        count_error = ERRORS.labels(component).inc if component else lambda: None
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                except Exception:
+                    count_error()
+                    raise
+                finally:
+                    observe(time.perf_counter() - started)
+        elif inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    yield from func(*args, **kwargs)
+                except Exception:
+                    count_error()
+                    raise
+                finally:
+                    observe(time.perf_counter() - started)
+        elif inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    count_error()
+                    raise
+                finally:
+                    observe(time.perf_counter() - started)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    count_error()
+                    raise
+                finally:
+                    observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+# database.py catches its own errors, db_cursor counts them
+db_timed = functools.partial(timed, DB_QUERY_SECONDS, None)
+llm_timed = functools.partial(timed, LLM_REQUEST_SECONDS, "llm")
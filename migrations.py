@@ -0,0 +1,99 @@
+import os
+import re
+from datetime import datetime
+
+from database import db_cursor, USER_FROM_SLACK_QUERY, USER_QUERY, USER_RELATIONS_QUERY, RECENT_FEEDBACK_QUERY, \
+    FEEDBACK_BY_ID_QUERY, UNCALCULATED_FEEDBACK_IDS_QUERY, FEEDBACK_MESSAGES_QUERY, EVALUATION_ROLLUP_QUERY, \
+    EVALUATION_COLUMNS, POSITIVE_SENTIMENT_WORDS_QUERY, NEGATIVE_SENTIMENT_WORDS_QUERY, EVALUATION_TREND_QUERY, \
+    LLM_CACHE_QUERY, CLAIM_EVALUATION_JOB_QUERY, evaluations_query
+
+DB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db")
+# Kept out of db/, which docker-compose can mount as docker-entrypoint-initdb.d: a fresh database only gets
+# 001-init.sql from there, and the later migrations are applied once each by apply_migrations
+MIGRATIONS_DIR = os.path.join(DB_DIR, "migrations")
+MIGRATION_FILE_PATTERN = re.compile(r"^(\d+)-.+\.sql$")
+
+# The read queries of database.py with placeholder parameters, as run by check_query_plans
+EXPLAIN_QUERIES = [
+    ("get_user_info_from_slack", USER_FROM_SLACK_QUERY, ("",)),
+    ("get_user_info", USER_QUERY, ("",)),
+    ("get_user_relations", USER_RELATIONS_QUERY, ("", "")),
+    ("get_feedback", RECENT_FEEDBACK_QUERY, ("", datetime.now())),
+    ("get_feedback_by_id", FEEDBACK_BY_ID_QUERY, ("",)),
+    ("get_uncalculated_feedback_ids", UNCALCULATED_FEEDBACK_IDS_QUERY, ("", datetime.now())),
+    ("fetch_feedback_messages", FEEDBACK_MESSAGES_QUERY.format(placeholders="%s"), ("",)),
+    ("get_evaluation_rollup", EVALUATION_ROLLUP_QUERY, ("", "")),
+    ("get_evaluation_trend", EVALUATION_TREND_QUERY, ("", "", "week", datetime.now().date())),
+    ("get_sentiment_words(positive)", POSITIVE_SENTIMENT_WORDS_QUERY, ("", "", 10)),
+    ("get_sentiment_words(negative)", NEGATIVE_SENTIMENT_WORDS_QUERY, ("", "", 10)),
+    ("fetch_evaluations(feedback_id)", evaluations_query(EVALUATION_COLUMNS, "FeedbackID"), ("",)),
+    ("fetch_evaluations(target_user_id)", evaluations_query(EVALUATION_COLUMNS, "TargetUserID"), ("",)),
+    ("fetch_evaluations(target_type)", evaluations_query(EVALUATION_COLUMNS, "EvaluationTargetType"), (1,)),
+    ("get_cached_llm_response", LLM_CACHE_QUERY, ("",)),
+    ("claim_evaluation_job", CLAIM_EVALUATION_JOB_QUERY, (datetime.now(), datetime.now())),
+]
+
+
+def list_migrations():
+    """(version, file name, path) of db/001-init.sql and every db/migrations/NNN-*.sql file, in version order."""
+    migrations = []
+    for directory in (DB_DIR, MIGRATIONS_DIR):
+        for file_name in os.listdir(directory):
+            match = MIGRATION_FILE_PATTERN.match(file_name)
+            if match:
+                migrations.append((int(match.group(1)), file_name, os.path.join(directory, file_name)))
+    return sorted(migrations)
+
+
+def apply_migrations():
+    """Apply every migration of list_migrations that has not been recorded in SchemaMigrations, in version order."""
+    with db_cursor() as (conn, cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS SchemaMigrations
+            (
+                Version   INT PRIMARY KEY,
+                Name      VARCHAR(255),
+                AppliedAt DATETIME
+            )
+        """)
+        cursor.execute("SELECT Version FROM SchemaMigrations")
+        applied = {row[0] for row in cursor.fetchall()}
+
+        # Databases created before the runner existed were initialised by docker-entrypoint from 001-init.sql
+        cursor.execute("SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'Feedback'")
+        if not applied and cursor.fetchone()[0]:
+            cursor.execute("INSERT INTO SchemaMigrations (Version, Name, AppliedAt) VALUES (%s, %s, %s)",
+                           (1, "001-init.sql", datetime.now()))
+            conn.commit()
+            applied.add(1)
+
+        for version, file_name, path in list_migrations():
+            if version in applied:
+                continue
+
+            with open(path) as migration_file:
+                sql = migration_file.read()
+
+            # Statements have to be consumed one by one for multi-statement execution to run them all
+            for _ in cursor.execute(sql, multi=True):
+                pass
+            cursor.execute("INSERT INTO SchemaMigrations (Version, Name, AppliedAt) VALUES (%s, %s, %s)",
+                           (version, file_name, datetime.now()))
+            conn.commit()
+            print(f"Migration {file_name} has been applied.")
+
+
+def check_query_plans():
+    """EXPLAIN every read query of database.py and return the ones that scan a whole table."""
+    full_scans = []
+    with db_cursor() as (_, cursor):
+        for name, query, values in EXPLAIN_QUERIES:
+            cursor.execute("EXPLAIN " + query, values)
+            columns = cursor.column_names
+            for row in cursor.fetchall():
+                plan = dict(zip(columns, row))
+                # Derived tables such as <union1,2> are temporary results, not stored tables
+                if plan["type"] == "ALL" and not str(plan["table"]).startswith("<"):
+                    full_scans.append((name, plan["table"]))
+                    print(f"Full scan of {plan['table']} in {name}.")
+    return full_scans
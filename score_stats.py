@@ -0,0 +1,127 @@
+import numpy as np
+
+from evaluation_specs import EVALUATION_TOPICS
+
+DEFAULT_PERCENTILES = (25, 50, 75)
+TIME_BUCKETS = ("day", "week")
+
+
+class TopicScores:
+    """Scores and weights of N evaluations as two (N x topics) float arrays, with an optional group key per row.
+
+    A NULL score or weight is NaN and leaves that topic of the row out, as calculate_average_scores
+    does. Counts and percentiles only include rows that rated the topic, i.e. with a positive weight.
+    """
+
+    def __init__(self, scores, weights, keys=None):
+        self.scores = scores
+        self.weights = weights
+        self.keys = keys
+
+    @classmethod
+    def from_chunks(cls, chunks, with_key=False):
+        """Build from chunks of rows holding the SCORE_COLUMNS, preceded by the group key if with_key."""
+        score_arrays, key_arrays = [], []
+        for rows in chunks:
+            if with_key:
+                values = np.array(rows, dtype=object)
+                key_arrays.append(values[:, 0])
+                values = values[:, 1:].astype(float)
+            else:
+                values = np.array(rows, dtype=float)
+            score_arrays.append(values)
+
+        if score_arrays:
+            values = np.concatenate(score_arrays)
+        else:
+            values = np.empty((0, 2 * len(EVALUATION_TOPICS)))
+        keys = (np.concatenate(key_arrays) if key_arrays else np.empty(0, dtype=object)) if with_key else None
+        if keys is not None:
+            # A NULL key, e.g. an evaluation without TargetUserID, groups under "" since None does not sort
+            keys[np.equal(keys, None)] = ""
+        # SCORE_COLUMNS alternates each topic's score and weight
+        return cls(values[:, 0::2], values[:, 1::2], keys)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def summary(self, percentiles=DEFAULT_PERCENTILES):
+        """Topic -> mean, std, count and percentiles, leaving out topics no evaluation rated."""
+        return self._statistics(np.zeros(len(self), dtype=np.intp), 1, percentiles)[0]
+
+    def grouped_summary(self, percentiles=DEFAULT_PERCENTILES):
+        """Group key -> summary(), computing every group in the same vectorized passes over the rows."""
+        groups, inverse = np.unique(self.keys, return_inverse=True)
+        return dict(zip((_key(group) for group in groups), self._statistics(inverse, len(groups), percentiles)))
+
+    def _statistics(self, inverse, group_count, percentiles):
+        valid = ~np.isnan(self.scores) & ~np.isnan(self.weights)
+        scores = np.where(valid, self.scores, 0.0)
+        weights = np.where(valid, self.weights, 0.0)
+        rated = valid & (weights > 0)
+
+        total_weights = _group_sums(inverse, weights, group_count)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = _group_sums(inverse, scores * weights, group_count) / total_weights
+            variances = _group_sums(inverse, weights * (scores - means[inverse]) ** 2, group_count) / total_weights
+        stds = np.sqrt(variances)
+        counts = _group_sums(inverse, rated, group_count).astype(int)
+        topic_percentiles = _group_percentiles(inverse, scores, rated, counts, percentiles)
+
+        results = []
+        for group in range(group_count):
+            stats = {}
+            for topic in np.flatnonzero(counts[group]):
+                topic_stats = {"mean": float(means[group, topic]), "std": float(stds[group, topic]),
+                               "count": int(counts[group, topic])}
+                for index, percentile in enumerate(percentiles):
+                    topic_stats[f"p{percentile}"] = float(topic_percentiles[index, group, topic])
+                stats[EVALUATION_TOPICS[topic]] = topic_stats
+            results.append(stats)
+        return results
+
+
+def _group_sums(inverse, values, group_count):
+    """(groups x topics) sums of the (rows x topics) values, rows assigned to groups by inverse."""
+    return np.stack([np.bincount(inverse, weights=values[:, topic], minlength=group_count)
+                     for topic in range(values.shape[1])], axis=1)
+
+
+def _group_percentiles(inverse, scores, rated, counts, percentiles):
+    """(percentiles x groups x topics) percentiles of the rated scores, interpolated like np.percentile."""
+    result = np.full((len(percentiles), *counts.shape), np.nan)
+    for topic in range(scores.shape[1]):
+        topic_rated = rated[:, topic]
+        topic_groups = inverse[topic_rated]
+        topic_scores = scores[topic_rated, topic]
+        # Sorting by group, then score, lays each group's scores out in order one after another
+        sorted_scores = topic_scores[np.lexsort((topic_scores, topic_groups))]
+        topic_counts = counts[:, topic]
+        has_ratings = topic_counts > 0
+        starts = (np.cumsum(topic_counts) - topic_counts)[has_ratings]
+        last = topic_counts[has_ratings] - 1
+        for index, percentile in enumerate(percentiles):
+            position = last * (percentile / 100)
+            lower = np.floor(position).astype(np.intp)
+            upper = np.minimum(lower + 1, last)
+            fraction = position - lower
+            below, above = sorted_scores[starts + lower], sorted_scores[starts + upper]
+            result[index, has_ratings, topic] = below + (above - below) * fraction
+    return result
+
+
+def time_buckets(timestamps, bucket):
+    """Start of the day, or of the week (Monday), each timestamp falls in, as datetime64[D]."""
+    if bucket not in TIME_BUCKETS:
+        raise ValueError(f"Unknown time bucket {bucket!r}, expected one of {TIME_BUCKETS}")
+    days = np.asarray(timestamps, dtype="datetime64[s]").astype("datetime64[D]")
+    if bucket == "week":
+        # Day 0 of datetime64, 1970-01-01, was a Thursday
+        days = days - ((days.astype("int64") + 3) % 7).astype("timedelta64[D]")
+    return days
+
+
+def _key(group):
+    if isinstance(group, np.datetime64):
+        return str(group)
+    return group.item() if isinstance(group, np.generic) else group
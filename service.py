@@ -1,28 +1,40 @@
 import json
-
-from database import get_feedback, insert_feedback, update_feedback_data, get_uncalculated_feedbacks, insert_evaluation, \
-    mark_feedback_as_calculated, get_evaluations_from_target_user_id_or_target_type
-from evaluation_specs import EVALUATION_FUNCTIONS_SPEC
-from gpt import chat_with_gpt3, evaluate_with_gpt3
-
-FEEDBACK_LENGTH_SOFT_LIMIT = 14
-FEEDBACK_LENGTH_HARD_LIMIT = 22
+import os
+from datetime import datetime, timedelta
+
+from database import insert_feedback, get_uncalculated_feedback_ids, insert_evaluations, \
+    get_evaluation_rollup, get_sentiment_words, get_cached_llm_response, put_cached_llm_response, enqueue_evaluation_job, \
+    iter_evaluations, iter_evaluation_chunks, get_evaluation_trend, trend_bucket_start, run_db, ROLLUP_USER, \
+    ROLLUP_COMPANY, COMPANY_ROLLUP_KEY, TREND_WEEK
+from evaluation_records import SCORE_COLUMNS
+from evaluation_specs import EVALUATION_FUNCTIONS_SPEC, EVALUATION_TOPICS
+from gpt import chat_with_gpt3, evaluate_with_gpt3, chat_with_gpt3_async, \
+    stream_chat_with_gpt3, stream_chat_with_gpt3_async, request_hash, GPT_MODEL
+from score_stats import TopicScores, time_buckets, TIME_BUCKETS
+from sessions import feedback_sessions
+from tokens import message_tokens
+from tracing import add_span_attributes, traced
+
+# Token totals of a whole session: past the soft limit Wevo is asked to wrap up, past the hard limit turns are not kept
+FEEDBACK_TOKEN_SOFT_LIMIT = int(os.getenv('FEEDBACK_TOKEN_SOFT_LIMIT', '2500'))
+FEEDBACK_TOKEN_HARD_LIMIT = int(os.getenv('FEEDBACK_TOKEN_HARD_LIMIT', '4000'))
+# Most tokens sent to the model in one turn, older turns beyond it are replaced by a summary
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '2000'))
+SUMMARY_MAX_EXCERPTS = 8
+SUMMARY_EXCERPT_LENGTH = 80
+# Room kept for the summary message, which is at most SUMMARY_MAX_EXCERPTS short lines of English text
+SUMMARY_TOKEN_RESERVE = 200
+
+# The turns a user sent while another process wrote the same feedback are not kept
+FEEDBACK_CONFLICT_MESSAGE = "Another message of yours was answered at the same time, so your last messages " \
+                            "were not kept. Please send them again."
+
+# Days or weeks in an evaluation trend, up to and including the current one
+TREND_PERIODS = int(os.getenv('TREND_PERIODS', '12'))
 
 
 def generate_initial_conversation_data(user_name, company_name, relations):
-    evaluation_criteria = [
-        "Company_Fulfillment",
-        "Company_Autonomy",
-        "Company_GrowthOpportunities",
-        "Company_Workload",
-        "Company_Stress",
-        "Company_WorkLifeBalance",
-        "Person_Recognition",
-        "Person_Sympathy",
-        "Person_Trust",
-        "Person_ProSupport",
-        "Person_GrowthSupport"
-    ]
+    evaluation_criteria = EVALUATION_TOPICS
 
     message = f"""This is an automated system. This text is generated by the system.
 After this, you will be responding to our client: the user.
@@ -105,106 +117,433 @@ SubjectName should be filled if the EvaluationTargetType is either 2 OR 3.
     return messages
 
 
-def add_message_limit_reached_message(data):
+def add_message_limit_reached_message(feedback):
     message = """This is a message from the system.
 Message limit is about to be reached.
 Try to close the communication with the user and try not to initiate any more conversation.
 You will be facing our user again after this.
 """
-    data.append({"role": "system", "content": message})
+    add_message(feedback, {"role": "system", "content": message})
 
 
-def initiate_feedback(user_id, user_name, company_name, relations):
+def summarize_trimmed_messages(messages):
+    excerpts = [
+        f"- {message['content'][:SUMMARY_EXCERPT_LENGTH]}"
+        for message in messages if message["role"] == "user" and message["content"]
+    ][-SUMMARY_MAX_EXCERPTS:]
+
+    message = """This is a message from the system.
+Earlier messages of this conversation were removed to keep it short.
+""" + ("Things the user said earlier:\n" + "\n".join(excerpts) if excerpts else "")
+    return {"role": "system", "content": message}
+
+
+@traced()
+def build_prompt(feedback):
+    """Messages to send for the next reply: the system prompt, a summary of trimmed turns and the newest turns."""
+    messages, token_counts = feedback["Data"], feedback["TokenCounts"]
+    add_span_attributes(session_messages=len(messages), session_tokens=sum(token_counts))
+    if sum(token_counts) <= PROMPT_TOKEN_BUDGET:
+        return messages
+
+    # The newest message is always sent, older ones only while they fit next to the system prompt
+    start = len(messages) - 1
+    budget = PROMPT_TOKEN_BUDGET - token_counts[0] - token_counts[start] - SUMMARY_TOKEN_RESERVE
+    while start > 1 and token_counts[start - 1] <= budget:
+        start -= 1
+        budget -= token_counts[start]
+
+    if start <= 1:
+        return messages
+    return [messages[0], summarize_trimmed_messages(messages[1:start])] + messages[start:]
+
+
+def add_message(feedback, message):
+    # Token counts are estimated once per message and travel with it to FeedbackMessages
+    feedback["Data"].append(message)
+    feedback["TokenCounts"].append(message_tokens(message))
+
+
+def create_feedback(user_id, user_name, company_name, relations):
+    """Store a new feedback with its initial messages, returning them, their token counts and the feedback ID."""
     data = generate_initial_conversation_data(user_name, company_name, relations)
-    feedback_id = insert_feedback(user_id, data)
+    token_counts = [message_tokens(message) for message in data]
+    feedback_id = insert_feedback(user_id, data, token_counts)
+    return data, token_counts, feedback_id
+
+
+@traced()
+def initiate_feedback(user_id, user_name, company_name, relations):
+    data, token_counts, feedback_id = create_feedback(user_id, user_name, company_name, relations)
 
     response_message = chat_with_gpt3(data)
-    data.append(response_message)
-    update_feedback_data(user_id, data)
+    open_session(user_id, feedback_id, data, token_counts, response_message)
 
     return response_message['content'], feedback_id
 
 
+def initiate_feedback_stream(user_id, user_name, company_name, relations):
+    """Like initiate_feedback, but returns the greeting as a generator of text pieces."""
+    data, token_counts, feedback_id = create_feedback(user_id, user_name, company_name, relations)
+
+    def stream():
+        parts = []
+        for part in stream_chat_with_gpt3(data):
+            parts.append(part)
+            yield part
+        open_session(user_id, feedback_id, data, token_counts, {"role": "assistant", "content": "".join(parts)})
+
+    return stream(), feedback_id
+
+
+def open_session(user_id, feedback_id, data, token_counts, response_message):
+    if not feedback_id:
+        return
+
+    # The initial messages were stored by insert_feedback, the greeting is written behind
+    feedback = {
+        'ID': feedback_id,
+        'UserID': user_id,
+        'TargetUserID': None,
+        'Timestamp': datetime.now(),
+        'Data': data,
+        'TokenCounts': token_counts,
+        'IsCalculated': False,
+        'Version': len(data)
+    }
+    add_message(feedback, response_message)
+    feedback_sessions.put(feedback)
+    feedback_sessions.mark_dirty(feedback)
+
+
+def add_user_message(feedback, message):
+    add_message(feedback, {"role": "user", "content": message})
+
+    if sum(feedback["TokenCounts"]) > FEEDBACK_TOKEN_SOFT_LIMIT:
+        add_message_limit_reached_message(feedback)
+
+
+def discard_turn(feedback, turn_start):
+    del feedback["Data"][turn_start:]
+    del feedback["TokenCounts"][turn_start:]
+
+
+def store_response_message(feedback, turn_start, response_message):
+    add_message(feedback, response_message)
+
+    if sum(feedback["TokenCounts"]) > FEEDBACK_TOKEN_HARD_LIMIT:
+        # Turns past the hard limit are answered but not kept
+        discard_turn(feedback, turn_start)
+        return
+
+    feedback_sessions.mark_dirty(feedback)
+
+
+def load_session(user_id):
+    """(True, None) once after a conflicting write dropped the user's session, else (False, the open session or None)."""
+    if feedback_sessions.take_conflict(user_id):
+        return True, None
+    return False, feedback_sessions.get(user_id)
+
+
+class FeedbackTurn:
+    """One user message and the model's reply to it, in the cached session.
+
+    Entering adds the user's message. Leaving with an exception, which includes a reply stream closed
+    before its end, discards the turn, so the cached session is as it was and the user can simply
+    send the message again.
+    """
+
+    def __init__(self, feedback, message):
+        self.feedback = feedback
+        self.message = message
+        self.start = None
+
+    def __enter__(self):
+        self.start = len(self.feedback["Data"])
+        add_user_message(self.feedback, self.message)
+        add_span_attributes(feedback_id=self.feedback["ID"])
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            discard_turn(self.feedback, self.start)
+
+    def prompt(self):
+        return build_prompt(self.feedback)
+
+    def store(self, response_message):
+        store_response_message(self.feedback, self.start, response_message)
+
+
+@traced()
 def continue_feedback(user_id, message):
-    feedback = get_feedback(user_id)
+    conflict, feedback = load_session(user_id)
+    if conflict:
+        return FEEDBACK_CONFLICT_MESSAGE
     if not feedback:
         return None
 
-    feedback_data = feedback["Data"]
-    feedback_data.append({"role": "user", "content": message})
+    with FeedbackTurn(feedback, message) as turn:
+        response_message = chat_with_gpt3(turn.prompt())
+        turn.store(response_message)
 
-    if len(feedback_data) > FEEDBACK_LENGTH_SOFT_LIMIT:
-        add_message_limit_reached_message(feedback_data)
+    return response_message['content']
 
-    response_message = chat_with_gpt3(feedback_data)
-    feedback_data.append(response_message)
 
-    if len(feedback_data) <= FEEDBACK_LENGTH_HARD_LIMIT:
-        update_feedback_data(user_id, feedback_data)
+def continue_feedback_stream(user_id, message):
+    """Like continue_feedback, but returns the reply as a generator of text pieces.
 
-    return response_message['content']
+    The turn starts on the first iteration and is stored once the generator is exhausted.
+    """
+    conflict, feedback = load_session(user_id)
+    if conflict:
+        return iter([FEEDBACK_CONFLICT_MESSAGE])
+    if not feedback:
+        return None
+
+    def stream():
+        with FeedbackTurn(feedback, message) as turn:
+            parts = []
+            for part in stream_chat_with_gpt3(turn.prompt()):
+                parts.append(part)
+                yield part
+            turn.store({"role": "assistant", "content": "".join(parts)})
+
+    return stream()
 
 
-def calculate_feedback(feedback):
-    feedback_data = feedback["Data"]
-    feedback_id = feedback["ID"]
-    calculation_data_message = generate_initial_calculation_data(feedback_data)
+def parse_evaluations(response_message):
+    """The evaluations of the model's insert_evaluation call, raising ValueError if its arguments are malformed."""
+    if not response_message.get("function_call"):
+        return []
+    try:
+        evaluations = json.loads(response_message["function_call"]["arguments"])["evaluations"]
+    except (KeyError, TypeError) as error:
+        raise ValueError(f"Evaluation arguments without evaluations: {error!r}") from error
+    if not isinstance(evaluations, list) or not all(isinstance(evaluation, dict) for evaluation in evaluations):
+        raise ValueError("Evaluation arguments are not a list of evaluations")
+    return evaluations
+
+
+@traced()
+def store_evaluations(feedback, evaluations):
+    add_span_attributes(feedback_id=feedback["ID"], evaluations=len(evaluations))
+
+    # All or nothing: a failure leaves the feedback uncalculated so it can be evaluated again
+    insert_evaluations(feedback["UserID"], feedback["ID"], evaluations)
+
+
+def cached_evaluations(cache_key):
+    arguments = get_cached_llm_response(cache_key)
+    if arguments is None:
+        return None
+    try:
+        return parse_evaluations({"function_call": {"name": "insert_evaluation", "arguments": arguments}})
+    except ValueError as error:
+        # Entries cached before the arguments were validated, ask the model again
+        print(f"Ignoring malformed cached evaluation: {error}")
+        return None
+
+
+def cache_evaluation_message(cache_key, response_message):
+    if response_message.get("function_call"):
+        put_cached_llm_response(cache_key, GPT_MODEL, response_message["function_call"]["arguments"])
+
+
+@traced()
+def calculate_feedback(feedback, force=False):
+    """Evaluate one feedback, reusing the stored result of an identical earlier request unless force is set."""
+    calculation_data_message = generate_initial_calculation_data(feedback["Data"])
     function = EVALUATION_FUNCTIONS_SPEC
+    cache_key = request_hash(calculation_data_message, function)
+
+    evaluations = None if force else cached_evaluations(cache_key)
+    add_span_attributes(feedback_id=feedback["ID"], messages=len(feedback["Data"]),
+                        cache_hit=evaluations is not None)
+    if evaluations is not None:
+        store_evaluations(feedback, evaluations)
+        return
 
     response_message = evaluate_with_gpt3(calculation_data_message, function)
-    if response_message.get("function_call"):
-        data_args = json.loads(response_message["function_call"]["arguments"])
-        evaluations = data_args["evaluations"]
-        for evaluation in evaluations:
-            insert_evaluation(feedback["UserID"], feedback_id, evaluation)
+    # Malformed arguments raise before they are cached, so a retry of the job asks the model again
+    store_evaluations(feedback, parse_evaluations(response_message))
+    cache_evaluation_message(cache_key, response_message)
+
 
-    mark_feedback_as_calculated(feedback_id)
+@traced()
+def enqueue_evaluations(user_id, slack_channel, slack_thread_ts, force=False):
+    """Queue every uncalculated feedback of the user for the evaluation workers in jobs.py."""
+    feedback_sessions.close_user(user_id)
+    feedback_ids = get_uncalculated_feedback_ids(user_id) or []
+    if not feedback_ids:
+        return "There is no feedback to evaluate."
 
+    for feedback_id in feedback_ids:
+        enqueue_evaluation_job(feedback_id, user_id, slack_channel, slack_thread_ts, force)
 
-def evaluate_feedback(user_id):
-    feedback_ids = []
-    feedbacks = get_uncalculated_feedbacks(user_id)
-    for feedback in feedbacks:
-        calculate_feedback(feedback)
-        feedback_ids.append(feedback["ID"])
-    return "All feedback has been processed." + f'\n```debug: feedback_ids: {feedback_ids}.```'
+    return f"{len(feedback_ids)} feedbacks have been queued for evaluation. I will reply in this thread when they are done." + \
+        f'\n```debug: feedback_ids: {feedback_ids}.```'
 
 
+@traced()
 def evaluation_for_user_id(user_id):
-    evaluations = get_evaluations_from_target_user_id_or_target_type(target_user_id=user_id)
-    return calculate_average_scores(evaluations)
+    return get_evaluation_rollup(ROLLUP_USER, user_id)
 
 
+@traced()
 def evaluation_for_company():
-    evaluations = get_evaluations_from_target_user_id_or_target_type(target_type=1)
-    return calculate_average_scores(evaluations)
+    return get_evaluation_rollup(ROLLUP_COMPANY, COMPANY_ROLLUP_KEY)
+
+
+@traced()
+def evaluation_trend_for_user_id(user_id, bucket_size=TREND_WEEK, topic=None, periods=TREND_PERIODS):
+    return evaluation_trend(ROLLUP_USER, user_id, bucket_size, topic, periods)
+
+
+@traced()
+def evaluation_trend_for_company(bucket_size=TREND_WEEK, topic=None, periods=TREND_PERIODS):
+    return evaluation_trend(ROLLUP_COMPANY, COMPANY_ROLLUP_KEY, bucket_size, topic, periods)
+
+
+def evaluation_trend(target_kind, target_key, bucket_size, topic, periods):
+    """Topic -> average score of each of the last periods days or weeks, oldest first.
+
+    Buckets without evaluations have a None score, topics without any in the whole period are left out.
+    """
+    step = timedelta(weeks=1) if bucket_size == TREND_WEEK else timedelta(days=1)
+    current = trend_bucket_start(datetime.now(), bucket_size)
+    bucket_starts = [current - step * index for index in reversed(range(periods))]
+
+    trend = get_evaluation_trend(target_kind, target_key, bucket_size, bucket_starts[0])
+    if trend is None:
+        return None
+    return {
+        trend_topic: [{'bucket': bucket_start, 'score': scores.get(bucket_start)} for bucket_start in bucket_starts]
+        for trend_topic, scores in trend.items()
+        if scores and topic in (None, trend_topic)
+    }
+
+
+@traced()
+def sentiment_words_for_user_id(user_id):
+    return get_sentiment_words(ROLLUP_USER, user_id)
+
+
+@traced()
+def sentiment_words_for_company():
+    return get_sentiment_words(ROLLUP_COMPANY, COMPANY_ROLLUP_KEY)
 
 
 def calculate_average_scores(evaluations):
-    topic_keys = [
-        'Company_Fulfillment',
-        'Company_Autonomy',
-        'Company_GrowthOpportunities',
-        'Company_Workload',
-        'Company_Stress',
-        'Company_WorkLifeBalance',
-        'Person_Recognition',
-        'Person_Sympathy',
-        'Person_Trust',
-        'Person_ProSupport',
-        'Person_GrowthSupport',
-    ]
+    """Weighted average score per topic, in one pass so evaluations can be a stream of any length."""
+    total_scores = [0] * len(EVALUATION_TOPICS)
+    total_weights = [0] * len(EVALUATION_TOPICS)
+    topic_columns = list(enumerate((topic, f'{topic}Weight') for topic in EVALUATION_TOPICS))
 
-    average_scores = {}
-    for topic in topic_keys:
-        total_score = 0
-        total_weight = 0
-        for evaluation in evaluations:
+    for evaluation in evaluations:
+        for index, (topic, weight_column) in topic_columns:
             score = evaluation.get(topic)
-            weight = evaluation.get(f'{topic}Weight')
+            weight = evaluation.get(weight_column)
             if score is not None and weight is not None:
-                total_score += score * weight * 100
-                total_weight += weight * 100
-        average_scores[topic] = total_score / total_weight if total_weight else None
+                total_scores[index] += score * weight * 100
+                total_weights[index] += weight * 100
+
+    return {topic: total_scores[index] / total_weights[index] if total_weights[index] else None
+            for index, topic in enumerate(EVALUATION_TOPICS)}
+
+
+def scan_average_scores(target_user_id=None, target_type=None):
+    """Average scores recomputed from every Evaluation row, streamed so memory stays flat however many there are."""
+    return calculate_average_scores(
+        iter_evaluations(SCORE_COLUMNS, target_user_id=target_user_id, target_type=target_type))
+
+
+@traced()
+def evaluation_statistics(target_user_id=None, target_type=None, group_by=None):
+    """Weighted mean and std, count and percentiles of each topic's scores over the matching evaluations.
+
+    group_by is None, 'user' for one summary per TargetUserID, or a time bucket ('day' or 'week')
+    of the evaluation Timestamp.
+    """
+    if group_by is None:
+        key_column = None
+    elif group_by == 'user':
+        key_column = 'TargetUserID'
+    elif group_by in TIME_BUCKETS:
+        key_column = 'Timestamp'
+    else:
+        raise ValueError(f"Unknown grouping {group_by!r}")
+
+    columns = [key_column, *SCORE_COLUMNS] if key_column else SCORE_COLUMNS
+    chunks = iter_evaluation_chunks(columns, target_user_id=target_user_id, target_type=target_type,
+                                    weights_as_double=True)
+    topic_scores = TopicScores.from_chunks(chunks, with_key=key_column is not None)
+    add_span_attributes(evaluations=len(topic_scores))
+    if key_column is None:
+        return topic_scores.summary()
+    if group_by in TIME_BUCKETS:
+        topic_scores.keys = time_buckets(topic_scores.keys, group_by)
+    return topic_scores.grouped_summary()
+
+
+@traced()
+async def initiate_feedback_async(user_id, user_name, company_name, relations):
+    data, token_counts, feedback_id = await run_db(create_feedback, user_id, user_name, company_name, relations)
+
+    response_message = await chat_with_gpt3_async(data)
+    # Caching the session can evict another one, whose messages are then written to the database
+    await run_db(open_session, user_id, feedback_id, data, token_counts, response_message)
+
+    return response_message['content'], feedback_id
+
+
+@traced()
+async def continue_feedback_async(user_id, message):
+    conflict, feedback = await run_db(load_session, user_id)
+    if conflict:
+        return FEEDBACK_CONFLICT_MESSAGE
+    if not feedback:
+        return None
+
+    with FeedbackTurn(feedback, message) as turn:
+        response_message = await chat_with_gpt3_async(turn.prompt())
+        turn.store(response_message)
+
+    return response_message['content']
+
+
+async def initiate_feedback_stream_async(user_id, user_name, company_name, relations):
+    data, token_counts, feedback_id = await run_db(create_feedback, user_id, user_name, company_name, relations)
+
+    async def stream():
+        parts = []
+        async for part in stream_chat_with_gpt3_async(data):
+            parts.append(part)
+            yield part
+        await run_db(open_session, user_id, feedback_id, data, token_counts,
+                     {"role": "assistant", "content": "".join(parts)})
+
+    return stream(), feedback_id
+
+
+async def single_part_stream(text):
+    yield text
+
+
+async def continue_feedback_stream_async(user_id, message):
+    conflict, feedback = await run_db(load_session, user_id)
+    if conflict:
+        return single_part_stream(FEEDBACK_CONFLICT_MESSAGE)
+    if not feedback:
+        return None
+
+    async def stream():
+        with FeedbackTurn(feedback, message) as turn:
+            parts = []
+            async for part in stream_chat_with_gpt3_async(turn.prompt()):
+                parts.append(part)
+                yield part
+            turn.store({"role": "assistant", "content": "".join(parts)})
 
-    return average_scores
+    return stream()
@@ -0,0 +1,150 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+from cache import TTLCache
+from database import get_feedback, append_feedback_messages
+from metrics import ACTIVE_SESSIONS, ERRORS
+
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', '1000'))
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', '900'))
+SESSION_FLUSH_INTERVAL_SECONDS = float(os.getenv('SESSION_FLUSH_INTERVAL_SECONDS', '0.3'))
+
+# Same window get_feedback uses to decide whether a session is still open
+SESSION_MAX_AGE = timedelta(days=2)
+
+
+class FeedbackSessions:
+    """Open feedback conversations kept in memory, keyed by user ID.
+
+    Turns read and extend the cached session. Messages past the session's stored
+    Version are written to FeedbackMessages by a background flusher, and on eviction,
+    but only up to its Committed length: a turn in progress may still be discarded.
+    """
+
+    def __init__(self, max_size=SESSION_CACHE_SIZE, ttl=SESSION_TTL_SECONDS,
+                 flush_interval=SESSION_FLUSH_INTERVAL_SECONDS):
+        self.flush_interval = flush_interval
+        self._cache = TTLCache(max_size, ttl, on_evict=self._on_evict)
+        self._dirty = {}
+        self._dirty_lock = threading.Lock()
+        self._flush_lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+        # Users whose cached session was dropped after a conflicting write, until their next turn
+        self._conflicts = set()
+
+    def get(self, user_id):
+        feedback = self._cache.get(user_id)
+        if feedback is not None and feedback["Timestamp"] < datetime.now() - SESSION_MAX_AGE:
+            self._cache.pop(user_id)
+            feedback = None
+
+        if feedback is None:
+            feedback = get_feedback(user_id)
+            if feedback:
+                feedback["Committed"] = len(feedback["Data"])
+                self._cache.put(user_id, feedback)
+        return feedback
+
+    def put(self, feedback):
+        self._cache.put(feedback["UserID"], feedback)
+
+    def mark_dirty(self, feedback):
+        """Schedule the session's messages for writing, all of them now belonging to finished turns."""
+        feedback["Committed"] = len(feedback["Data"])
+        with self._dirty_lock:
+            self._dirty[feedback["ID"]] = feedback
+        self._start_flusher()
+
+    def take_conflict(self, user_id):
+        """True once after the user's cached session was dropped because of a conflicting write."""
+        with self._dirty_lock:
+            if user_id not in self._conflicts:
+                return False
+            self._conflicts.discard(user_id)
+            return True
+
+    def close_user(self, user_id):
+        """Flush and forget the user's cached session, e.g. before it is evaluated.
+
+        Returns once its messages are written, even when the flusher had already taken it.
+        """
+        feedback = self._cache.pop(user_id)
+        if feedback is not None:
+            # Waits for a flush in progress on the flush lock, then writes whatever it left
+            self._flush_feedback(feedback)
+
+    def flush(self):
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, {}
+
+        for feedback in dirty.values():
+            self._flush_feedback(feedback)
+
+    def close(self):
+        """Stop the flusher and write every pending message. Called on shutdown."""
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self._cache.clear()
+        self.flush()
+
+    def stats(self):
+        stats = self._cache.stats()
+        with self._dirty_lock:
+            stats["dirty"] = len(self._dirty)
+        return stats
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _on_evict(self, user_id, feedback):
+        with self._dirty_lock:
+            is_dirty = self._dirty.pop(feedback["ID"], None) is not None
+        if is_dirty:
+            self._flush_feedback(feedback)
+
+    def _flush_feedback(self, feedback):
+        # Serialised so an eviction and the flusher never append the same messages twice
+        with self._flush_lock:
+            # A turn only changes messages past Committed, so this part of the lists is stable
+            version, committed = feedback["Version"], feedback["Committed"]
+            messages = feedback["Data"][version:committed]
+            token_counts = feedback["TokenCounts"][version:committed]
+            if not messages:
+                return
+
+            new_version = append_feedback_messages(feedback["ID"], version, messages, token_counts)
+            if new_version is None:
+                # The database has moved on without this process, so the cached copy is dropped
+                print(f"Dropping cached feedback ID {feedback['ID']} after a conflicting write.")
+                user_id = feedback["UserID"]
+                dropped = self._cache.pop_if(user_id, lambda cached: cached["ID"] == feedback["ID"])
+                # No conflict to report when the user has moved on to a new session, which stays cached
+                if dropped is not None or self._cache.peek(user_id) is None:
+                    with self._dirty_lock:
+                        self._conflicts.add(user_id)
+                return
+
+            feedback["Version"] = new_version
+
+    def _start_flusher(self):
+        with self._flusher_lock:
+            if self._flusher is None and not self._stopped.is_set():
+                self._flusher = threading.Thread(target=self._run_flusher, name="wevo-session-flusher", daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self._cache.evict_expired()
+                self.flush()
+            except Exception as error:
+                ERRORS.labels("session_flush").inc()
+                print(f"Failed to flush feedback sessions: {error}")
+
+
+feedback_sessions = FeedbackSessions()
+ACTIVE_SESSIONS.set_function(lambda: len(feedback_sessions))
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import signal
+import sys
+import time
+
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from slack_bolt.async_app import AsyncApp
+from slack_sdk import WebClient
+from slack_sdk.web.async_client import AsyncWebClient
+
+from commands import CMD_CREATE_USER, CMD_WHO_AM_I, CMD_ASSUME_USER, CMD_MANUAL_START, CMD_MANUAL_CALCULATE, \
+    CMD_GET_EVALUATION, CMD_SET_RELATION, CMD_HELP, MANUAL, STREAM_REPLIES, STREAM_UPDATE_INTERVAL_SECONDS, \
+    STREAM_PLACEHOLDER, STREAM_FAILED_MESSAGE
+from database import get_user_info_from_slack, run_db
+from dispatch import async_user_dispatcher
+from handlers import who_am_i_reply, create_user_reply, assume_user_reply, set_relation_reply, manual_calculate_reply, \
+    evaluation_reply, feedback_id_reply, NOT_REGISTERED_MESSAGE, CHAT_NOT_REGISTERED_MESSAGE, SESSION_CLOSED_MESSAGE
+from jobs import EvaluationWorkers
+from service import initiate_feedback_async, continue_feedback_async, initiate_feedback_stream_async, \
+    continue_feedback_stream_async
+from sessions import feedback_sessions
+from web import make_app
+
+# The commands of slack.py on the Tornado IOLoop: Slack and OpenAI calls are awaited, and the MySQL-bound
+# replies of handlers.py run on the database threads
+SLACK_API_BASE_URL = os.getenv('SLACK_API_BASE_URL', WebClient.BASE_URL)
+
+app = AsyncApp(
+    client=AsyncWebClient(token=os.getenv('SLACK_TOKEN'), base_url=SLACK_API_BASE_URL),
+    signing_secret=os.getenv('SLACK_SECRET')
+)
+
+
+async def say_streaming(say, client, parts, **kwargs):
+    posted = await say(STREAM_PLACEHOLDER, **kwargs)
+    text, shown_text = "", STREAM_PLACEHOLDER
+    last_update = float("-inf")
+
+    try:
+        async for part in parts:
+            text += part
+            if time.monotonic() - last_update >= STREAM_UPDATE_INTERVAL_SECONDS:
+                await client.chat_update(channel=posted["channel"], ts=posted["ts"], text=text)
+                shown_text, last_update = text, time.monotonic()
+    finally:
+        # Never leave the placeholder behind, even when the stream is empty or raises
+        final_text = text or STREAM_FAILED_MESSAGE
+        if final_text != shown_text:
+            await client.chat_update(channel=posted["channel"], ts=posted["ts"], text=final_text)
+    return text
+
+
+@app.message(CMD_HELP)
+@async_user_dispatcher.ordered
+async def help_handler(message, say):
+    await say(MANUAL)
+
+
+@app.message(CMD_WHO_AM_I)
+@async_user_dispatcher.ordered
+async def who_am_i_handler(message, say):
+    await say(await run_db(who_am_i_reply, message), thread_ts=message['ts'])
+
+
+@app.message(CMD_CREATE_USER)
+@async_user_dispatcher.ordered
+async def create_user_handler(message, say):
+    await say(await run_db(create_user_reply, message), thread_ts=message['ts'])
+
+
+@app.message(CMD_ASSUME_USER)
+@async_user_dispatcher.ordered
+async def assume_user_handler(message, say):
+    await say(await run_db(assume_user_reply, message), thread_ts=message['ts'])
+
+
+@app.message(CMD_SET_RELATION)
+@async_user_dispatcher.ordered
+async def set_relation_handler(message, say):
+    await say(await run_db(set_relation_reply, message), thread_ts=message['ts'])
+
+
+@app.message(CMD_MANUAL_START)
+@async_user_dispatcher.ordered
+async def manual_start_handler(message, say, client):
+    user_id, user_name, relations = await run_db(get_user_info_from_slack, message['user'], get_relations=True)
+    if not user_id:
+        await say(NOT_REGISTERED_MESSAGE, thread_ts=message['ts'])
+        return
+
+    if STREAM_REPLIES:
+        response_parts, feedback_id = await initiate_feedback_stream_async(
+            user_id, user_name, "Anything Forward", relations)
+        await say(feedback_id_reply(feedback_id), thread_ts=message['ts'])
+        await say_streaming(say, client, response_parts)
+        return
+
+    response_msg, feedback_id = await initiate_feedback_async(user_id, user_name, "Anything Forward", relations)
+    await say(feedback_id_reply(feedback_id), thread_ts=message['ts'])
+    await say(response_msg)
+
+
+@app.message(CMD_MANUAL_CALCULATE)
+@async_user_dispatcher.ordered
+async def manual_calculate_handler(message, say):
+    await say(await run_db(manual_calculate_reply, message), thread_ts=message['ts'])
+
+
+@app.message(CMD_GET_EVALUATION)
+@async_user_dispatcher.ordered
+async def get_evaluation_handler(message, say):
+    await say(await run_db(evaluation_reply, message), thread_ts=message['ts'])
+
+
+@app.message()
+@async_user_dispatcher.ordered
+async def default_handler(message, say, client):
+    user_id, _, _ = await run_db(get_user_info_from_slack, message['user'])
+    if not user_id:
+        await say(CHAT_NOT_REGISTERED_MESSAGE)
+        return
+
+    if STREAM_REPLIES:
+        response_parts = await continue_feedback_stream_async(user_id, message["text"])
+        if not response_parts:
+            await say(SESSION_CLOSED_MESSAGE)
+        else:
+            await say_streaming(say, client, response_parts)
+        return
+
+    response_msg = await continue_feedback_async(user_id, message["text"])
+    if not response_msg:
+        await say(SESSION_CLOSED_MESSAGE)
+    else:
+        await say(response_msg)
+
+
+async def main():
+    tornado_app = make_app()
+    tornado_app.listen(8080)
+
+    # The workers run in their own threads, so they post with the blocking client
+    web_client = WebClient(token=os.getenv('SLACK_TOKEN'), base_url=SLACK_API_BASE_URL)
+    workers = EvaluationWorkers(
+        lambda channel, thread_ts, text: web_client.chat_postMessage(channel=channel, thread_ts=thread_ts, text=text))
+    workers.start()
+
+    try:
+        await AsyncSocketModeHandler(
+            app,
+            os.getenv('SLACK_APP_TOKEN')).start_async()
+    finally:
+        await async_user_dispatcher.shutdown()
+        await asyncio.get_running_loop().run_in_executor(None, workers.stop)
+        feedback_sessions.close()
+
+
+# Start your app
+if __name__ == "__main__":
+    # Turn SIGTERM from `docker stop` into a normal exit so pending session messages get flushed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+import json
+from contextlib import contextmanager
+
+import database
+
+
+class RecordingCursor:
+    """Records the rows written with executemany and serves result_rows to fetchmany, once."""
+
+    unread_result = False
+
+    def __init__(self, result_rows=()):
+        self.result_rows = list(result_rows)
+        self.executed = []
+        self.rows = []
+
+    def execute(self, query, values=None):
+        self.executed.append((query, values))
+
+    def executemany(self, query, rows):
+        self.rows.extend(rows)
+
+    def fetchmany(self, size):
+        rows, self.result_rows = self.result_rows[:size], self.result_rows[size:]
+        return rows
+
+    def commit(self):
+        pass
+
+
+def test_topic_contributions_coerce_model_output():
+    evaluation = {"Person_Trust": "80", "Person_TrustWeight": "0.5", "Person_Sympathy": "high",
+                  "Person_SympathyWeight": 1, "Person_Recognition": None}
+
+    contributions = {topic: (weighted_score, weight)
+                     for topic, weighted_score, weight in database.topic_contributions(evaluation)}
+
+    assert contributions["Person_Trust"] == (40.0, 0.5)
+    assert "Person_Sympathy" not in contributions
+    assert "Person_Recognition" not in contributions
+
+
+def test_rollup_upserts_in_key_order():
+    evaluations = [
+        {"EvaluationTargetType": 2, "SubjectUserID": "u2", "Person_Trust": 60, "Person_TrustWeight": 1},
+        {"EvaluationTargetType": 1, "SubjectUserID": "u1", "Person_Trust": 80, "Person_TrustWeight": 1},
+        {"EvaluationTargetType": 2, "SubjectUserID": "u2", "Person_Trust": 40, "Person_TrustWeight": 1},
+    ]
+    cursor = RecordingCursor()
+
+    database.update_evaluation_rollup(cursor, evaluations)
+
+    keys = [row[:3] for row in cursor.rows]
+    assert keys == sorted(keys) and len(keys) == len(set(keys))
+    assert (database.ROLLUP_USER, "u2", "Person_Trust", 100, 2) in cursor.rows
+
+
+def test_rebuild_sentiment_word_index_reads_every_evaluation_type(monkeypatch):
+    sentiment_data = json.dumps([{"word": "kind", "count": 1, "weight": 0.5}])
+    # A type the model was not asked for still counts towards its subject, as in rollup_targets
+    cursor = RecordingCursor([(4, "u1", "", sentiment_data)])
+
+    @contextmanager
+    def fake_db_cursor():
+        yield cursor, cursor
+
+    monkeypatch.setattr(database, "db_cursor", fake_db_cursor)
+
+    database.rebuild_sentiment_word_index()
+
+    assert "WHERE" not in cursor.executed[0][0]
+    assert (database.ROLLUP_USER, "u1", "kind", 1, 0.5) in cursor.rows
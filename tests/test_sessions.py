@@ -0,0 +1,177 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+import service
+import sessions
+from cache import TTLCache
+
+
+class FakeFeedbackStore:
+    """FeedbackMessages of one process, with the Version check of append_feedback_messages."""
+
+    def __init__(self):
+        self.versions = {}
+        self.written = []
+        self.stored = {}
+
+    def get_feedback(self, user_id):
+        return self.stored.get(user_id)
+
+    def append_feedback_messages(self, feedback_id, version, messages, token_counts):
+        if self.versions.get(feedback_id, version) != version:
+            return None
+        self.written.extend(message["content"] for message in messages)
+        self.versions[feedback_id] = version + len(messages)
+        return self.versions[feedback_id]
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FakeFeedbackStore()
+    monkeypatch.setattr(sessions, "get_feedback", store.get_feedback)
+    monkeypatch.setattr(sessions, "append_feedback_messages", store.append_feedback_messages)
+    return store
+
+
+@pytest.fixture
+def feedback_sessions(store, monkeypatch):
+    feedback_sessions = sessions.FeedbackSessions(flush_interval=1000)
+    monkeypatch.setattr(service, "feedback_sessions", feedback_sessions)
+    yield feedback_sessions
+    feedback_sessions.close()
+
+
+def open_feedback(feedback_sessions, feedback_id="f1", user_id="u1"):
+    feedback = {"ID": feedback_id, "UserID": user_id, "Timestamp": datetime.now(),
+                "Data": [{"role": "system", "content": "system"}], "TokenCounts": [1], "Version": 1}
+    feedback_sessions.put(feedback)
+    return feedback
+
+
+def finish_turn(feedback, user_message, reply):
+    turn_start = len(feedback["Data"])
+    service.add_user_message(feedback, user_message)
+    service.store_response_message(feedback, turn_start, {"role": "assistant", "content": reply})
+
+
+def test_flush_writes_finished_turns_once(store, feedback_sessions):
+    feedback = open_feedback(feedback_sessions)
+    finish_turn(feedback, "hi", "hello")
+
+    feedback_sessions.flush()
+    feedback_sessions.flush()
+
+    assert store.written == ["hi", "hello"]
+    assert feedback["Version"] == 3
+
+
+def test_flush_leaves_out_turn_in_progress(store, feedback_sessions):
+    feedback = open_feedback(feedback_sessions)
+    finish_turn(feedback, "hi", "hello")
+    turn_start = len(feedback["Data"])
+    service.add_user_message(feedback, "in progress")
+
+    feedback_sessions.flush()
+    service.discard_turn(feedback, turn_start)
+    finish_turn(feedback, "retry", "ok")
+    feedback_sessions.flush()
+
+    assert store.written == ["hi", "hello", "retry", "ok"]
+
+
+def test_eviction_flushes_dirty_session(store, monkeypatch):
+    feedback_sessions = sessions.FeedbackSessions(max_size=1, flush_interval=1000)
+    monkeypatch.setattr(service, "feedback_sessions", feedback_sessions)
+    feedback = open_feedback(feedback_sessions)
+    finish_turn(feedback, "hi", "hello")
+
+    open_feedback(feedback_sessions, "f2", "u2")
+
+    assert store.written == ["hi", "hello"]
+    feedback_sessions.close()
+
+
+def test_get_loads_committed_session(store, feedback_sessions):
+    store.stored["u1"] = {"ID": "f1", "UserID": "u1", "Timestamp": datetime.now(),
+                          "Data": [{"role": "system", "content": "system"}], "TokenCounts": [1], "Version": 1}
+
+    feedback = feedback_sessions.get("u1")
+
+    assert feedback["Committed"] == 1
+    assert feedback_sessions.get("u1") is feedback
+
+
+def test_close_user_waits_for_flush_in_progress(store, feedback_sessions, monkeypatch):
+    feedback = open_feedback(feedback_sessions)
+    finish_turn(feedback, "hi", "hello")
+    started, release = threading.Event(), threading.Event()
+
+    def slow_append(*args):
+        started.set()
+        release.wait()
+        return store.append_feedback_messages(*args)
+
+    monkeypatch.setattr(sessions, "append_feedback_messages", slow_append)
+    flusher = threading.Thread(target=feedback_sessions.flush)
+    flusher.start()
+    started.wait()
+
+    closer = threading.Thread(target=feedback_sessions.close_user, args=("u1",))
+    closer.start()
+    try:
+        closer.join(0.1)
+        assert closer.is_alive(), "close_user returned before the flush in progress had written"
+    finally:
+        release.set()
+        closer.join()
+        flusher.join()
+    assert store.written == ["hi", "hello"]
+
+
+def test_conflict_drops_session_and_is_reported_once(store, feedback_sessions):
+    feedback = open_feedback(feedback_sessions)
+    store.versions["f1"] = 5
+    finish_turn(feedback, "hi", "hello")
+
+    feedback_sessions.flush()
+
+    assert store.written == []
+    assert len(feedback_sessions) == 0
+    assert feedback_sessions.take_conflict("u1")
+    assert not feedback_sessions.take_conflict("u1")
+
+
+def test_conflict_of_replaced_session_keeps_new_one(store, feedback_sessions):
+    feedback = open_feedback(feedback_sessions)
+    store.versions["f1"] = 5
+    finish_turn(feedback, "hi", "hello")
+
+    new_feedback = open_feedback(feedback_sessions, "f2")
+
+    assert feedback_sessions.get("u1") is new_feedback
+    assert not feedback_sessions.take_conflict("u1")
+
+
+def test_cache_pop_if_checks_value():
+    evicted = []
+    cache = TTLCache(10, 60, on_evict=lambda key, value: evicted.append(key))
+    cache.put("a", 1)
+
+    assert cache.pop_if("a", lambda value: value == 2) is None
+    assert cache.peek("a") == 1
+    assert cache.pop_if("a", lambda value: value == 1) == 1
+    assert cache.peek("a") is None
+    assert evicted == ["a"]
+
+
+def test_failed_turn_leaves_session_as_it_was(store, feedback_sessions):
+    feedback = open_feedback(feedback_sessions)
+
+    with pytest.raises(RuntimeError):
+        with service.FeedbackTurn(feedback, "hi"):
+            raise RuntimeError("model unavailable")
+
+    assert [message["content"] for message in feedback["Data"]] == ["system"]
+    assert feedback["TokenCounts"] == [1]
@@ -0,0 +1,18 @@
+import math
+
+# Every chat message costs a few tokens of framing on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+# English averages about four characters per token, other scripts and emojis closer to one each
+ASCII_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Cheap offline approximation of the tokenizer, biased towards over-counting."""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return math.ceil(ascii_chars / ASCII_CHARS_PER_TOKEN) + (len(text) - ascii_chars)
+
+
+def message_tokens(message):
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content"))
@@ -0,0 +1,244 @@
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+# TRACE_EXPORTER is empty (tracing off), 'jsonl' (one span per line in TRACE_JSONL_PATH) or 'otlp'
+# (OTLP/HTTP JSON to TRACE_OTLP_ENDPOINT, e.g. a local OpenTelemetry collector)
+TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', '')
+TRACE_JSONL_PATH = os.getenv('TRACE_JSONL_PATH', 'traces.jsonl')
+TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+TRACE_EXPORT_BATCH_SIZE = 256
+TRACE_EXPORT_INTERVAL_SECONDS = 1.0
+SERVICE_NAME = "wevo"
+
+_current_span = contextvars.ContextVar("wevo_current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def as_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _SpanExporter:
+    """Writes finished spans from a background thread, so tracing never waits on disk or network."""
+
+    def __init__(self, write):
+        self._write = write
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="wevo-trace-exporter", daemon=True).start()
+
+    def export(self, span):
+        self._queue.put(span)
+
+    def flush(self):
+        """Write what is still queued, called at exit since the exporter thread is a daemon."""
+        spans = []
+        while True:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if spans:
+            self._write(spans)
+
+    def _run(self):
+        while True:
+            spans = [self._queue.get()]
+            deadline = time.monotonic() + TRACE_EXPORT_INTERVAL_SECONDS
+            while len(spans) < TRACE_EXPORT_BATCH_SIZE and time.monotonic() < deadline:
+                try:
+                    spans.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._write(spans)
+            except Exception as error:
+                print(f"Failed to export {len(spans)} spans: {error}")
+
+
+def _write_jsonl(spans):
+    with open(TRACE_JSONL_PATH, "a") as file:
+        for span in spans:
+            file.write(json.dumps(span.as_dict(), default=str) + "\n")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _write_otlp(spans):
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        otlp_spans.append(otlp_span)
+
+    payload = {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": otlp_spans}],
+    }]}
+    requests.post(TRACE_OTLP_ENDPOINT, json=payload, timeout=5).raise_for_status()
+
+
+_exporter = None
+if TRACE_EXPORTER == 'jsonl':
+    _exporter = _SpanExporter(_write_jsonl)
+elif TRACE_EXPORTER == 'otlp':
+    _exporter = _SpanExporter(_write_otlp)
+if _exporter is not None:
+    atexit.register(_exporter.flush)
+
+
+def is_enabled():
+    return _exporter is not None
+
+
+@contextmanager
+def span(name, new_trace=False, activate=True, **attributes):
+    """Time the block as a child of the current span, or as the root of a new trace.
+
+    With activate=False the span does not become the parent of spans opened inside the block.
+    Generators use that, since their block is suspended while the consumer runs.
+    """
+    if _exporter is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    if parent is None or new_trace:
+        current = Span(name, secrets.token_hex(16), None, attributes)
+    else:
+        current = Span(name, parent.trace_id, parent.span_id, attributes)
+
+    token = _current_span.set(current) if activate else None
+    try:
+        yield current
+    except Exception as error:
+        current.error = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        if token is not None:
+            _current_span.reset(token)
+        _exporter.export(current)
+
+
+def add_span_attributes(**attributes):
+    current = _current_span.get()
+    if current is not None:
+        current.set_attributes(**attributes)
+
+
+def traced(name=None):
+    """Decorator recording a span around each call of a function, coroutine or (async) generator."""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__name__}"
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with span(span_name, activate=False):
+                    async for item in func(*args, **kwargs):
+                        yield item
+        elif inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(span_name, activate=False):
+                    yield from func(*args, **kwargs)
+        elif inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(span_name):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracedCursor:
+    """Cursor wrapper recording a span for every statement it executes inside a trace.
+
+    Statements outside of any trace, like the evaluation workers' polling, are not recorded.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        if _current_span.get() is None:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        with span("sql", statement=_statement_summary(operation)) as current:
+            result = self._cursor.execute(operation, params, *args, **kwargs)
+            current.set_attributes(rows=self._cursor.rowcount)
+            return result
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        if _current_span.get() is None:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        seq_params = list(seq_params)
+        with span("sql", statement=_statement_summary(operation), batch_size=len(seq_params)) as current:
+            result = self._cursor.executemany(operation, seq_params, *args, **kwargs)
+            current.set_attributes(rows=self._cursor.rowcount)
+            return result
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+def _statement_summary(operation):
+    return " ".join(operation.split())[:200]
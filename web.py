@@ -0,0 +1,31 @@
+import tornado
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from database import get_pool_stats, get_user_cache_stats
+from dispatch import dispatch_stats
+from sessions import feedback_sessions
+
+
+class HealthCheckHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write({"status": "OK", "db_pool": get_pool_stats(), "sessions": feedback_sessions.stats(),
+                    "dispatch": dispatch_stats(), "user_cache": get_user_cache_stats()})
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", CONTENT_TYPE_LATEST)
+        self.write(generate_latest())
+
+
+def make_app():
+    return tornado.web.Application([
+        (r"/health", HealthCheckHandler),
+        (r"/metrics", MetricsHandler),
+    ])
+
+
+def run_tornado_server():
+    tornado_app = make_app()
+    tornado_app.listen(8080)
+    tornado.ioloop.IOLoop.current().start()